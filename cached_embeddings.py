@@ -0,0 +1,77 @@
+# ======================
+# Cached query embeddings
+# ======================
+
+from collections import OrderedDict
+import threading
+from langchain_core.embeddings import Embeddings
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that remembers the embeddings of recent queries, so repeated retriever
+    queries and object lookups skip the round trip to the embedding service. Document embeddings
+    are passed through uncached, since documents are only embedded when vector stores are built.
+    """
+
+    def __init__(self, embeddings: Embeddings, maxsize: int = 4096) -> None:
+        self.embeddings = embeddings
+        self.maxsize = maxsize
+        self._cache: OrderedDict[str, tuple[float, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, text: str) -> list[float] | None:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                return None
+            self._cache.move_to_end(text)
+        return list(vector)
+
+    def _put(self, text: str, vector: list[float]) -> list[float]:
+        with self._lock:
+            self._cache[text] = tuple(vector)
+            self._cache.move_to_end(text)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self._get(text)
+        if vector is None:
+            vector = self._put(text, self.embeddings.embed_query(text))
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = self._get(text)
+        if vector is None:
+            vector = self._put(text, await self.embeddings.aembed_query(text))
+        return vector
+
+    def _split_cached(self, texts: list[str]) -> tuple[list[list[float] | None], list[str]]:
+        vectors = [self._get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        return vectors, missing
+
+    def _fill(self, texts: list[str], vectors: list[list[float] | None], missing: list[str], embedded: list[list[float]]) -> list[list[float]]:
+        found = {text: self._put(text, vector) for text, vector in zip(missing, embedded)}
+        return [found[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed several queries known up front, sending the uncached ones in a single request.
+        This relies on the wrapped model embedding queries and documents the same way, as OCI embeddings do.
+        """
+        vectors, missing = self._split_cached(texts)
+        embedded = self.embeddings.embed_documents(missing) if missing else []
+        return self._fill(texts, vectors, missing, embedded)
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        vectors, missing = self._split_cached(texts)
+        embedded = await self.embeddings.aembed_documents(missing) if missing else []
+        return self._fill(texts, vectors, missing, embedded)
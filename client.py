@@ -5,11 +5,17 @@ from termcolor import colored
 import argparse
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import multiprocessing
 import traceback
 import contractions
 import uuid
+import hashlib
+import json
 import os
+import time
+import functools
+import threading
+from typing import TextIO
+from collections import OrderedDict
 
 # FastMCP imports
 from fastmcp import Client
@@ -21,7 +27,6 @@ from fastmcp.client.sampling import (
 
 # Agentic AI imports
 from langchain_community.chat_models.oci_generative_ai import ChatOCIGenAI
-from langchain_community.embeddings import OCIGenAIEmbeddings
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AnyMessage
 from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.prebuilt import create_react_agent
@@ -29,17 +34,17 @@ from langgraph.prebuilt.chat_agent_executor import AgentState
 
 # Short-term memory imports
 from langgraph.checkpoint.memory import InMemorySaver
-from langchain_core.messages.utils import trim_messages
 
 # Long-term memory imports
 import oracledb
 from langchain_community.vectorstores.oraclevs import OracleVS
-from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_core.documents import Document
 
 # Custom imports
 import workarounds
-from server import get_query, set_response, polling_supported
+from vector_store import MatrixVectorStore
+# Share the server's embed model (needed at startup to load long-term memory), so the process keeps one OCI client and its pooled connections
+from server import get_query, set_response, polling_supported, embed_model
 
 # =====
 # Setup
@@ -117,51 +122,51 @@ if args.database and not all(
     print(colored("Error: Missing DB information in config.ini.", "red"))
     sys.exit(0)
 
-# Initialize chat model
-chat_model_provider = "cohere"
-if not CHAT_MODEL_ID.startswith("cohere"):
-    chat_model_provider = "meta"
-
-chat_model = ChatOCIGenAI(
-    model_id=CHAT_MODEL_ID,
-    service_endpoint=SERVICE_ENDPOINT,
-    compartment_id=COMPARTMENT_ID,
-    model_kwargs={
-        "temperature": 0.3,
-        "max_tokens": 4000,
-    },
-    provider=chat_model_provider
-)
-
-# Initialize embed model
-embed_model = OCIGenAIEmbeddings(
-    model_id=EMBED_MODEL_ID,
-    service_endpoint=SERVICE_ENDPOINT,
-    compartment_id=COMPARTMENT_ID,
-)
+# Initialize chat model on first use
+@functools.lru_cache(maxsize=1)
+def get_chat_model() -> ChatOCIGenAI:
+    chat_model_provider = "cohere"
+    if not CHAT_MODEL_ID.startswith("cohere"):
+        chat_model_provider = "meta"
+    return ChatOCIGenAI(
+        model_id=CHAT_MODEL_ID,
+        service_endpoint=SERVICE_ENDPOINT,
+        compartment_id=COMPARTMENT_ID,
+        model_kwargs={
+            "temperature": 0.3,
+            "max_tokens": 4000,
+        },
+        provider=chat_model_provider
+    )
 
-# Initialize sampling model
-sampling_model_provider = "cohere"
-if not SAMPLING_MODEL_ID.startswith("cohere"):
-    sampling_model_provider = "meta"
-
-sampling_model = ChatOCIGenAI(
-    model_id=SAMPLING_MODEL_ID,
-    service_endpoint=SERVICE_ENDPOINT,
-    compartment_id=COMPARTMENT_ID,
-    model_kwargs={
-        "temperature": 0,
-        "max_tokens": 4000,
-    },
-    provider=sampling_model_provider
-)
+# Initialize sampling model on first use, since it is only needed for sampling and memory tools
+@functools.lru_cache(maxsize=1)
+def get_sampling_model() -> ChatOCIGenAI:
+    sampling_model_provider = "cohere"
+    if not SAMPLING_MODEL_ID.startswith("cohere"):
+        sampling_model_provider = "meta"
+    return ChatOCIGenAI(
+        model_id=SAMPLING_MODEL_ID,
+        service_endpoint=SERVICE_ENDPOINT,
+        compartment_id=COMPARTMENT_ID,
+        model_kwargs={
+            "temperature": 0,
+            "max_tokens": 4000,
+        },
+        provider=sampling_model_provider
+    )
 
 def get_current_time() -> str:
     """
     Get the current date and time in ISO 8601 format.
     This tool can help address queries involving a time relative to the current time.
     """
-    utc_now = datetime.now(ZoneInfo(TZ_IDENTIFIER))
+    return _get_time_of_second(int(time.time()))
+
+@functools.lru_cache(maxsize=1)
+def _get_time_of_second(second: int) -> str:
+    # Only recompute the ISO 8601 string once per second
+    utc_now = datetime.fromtimestamp(second, ZoneInfo(TZ_IDENTIFIER))
     local_now = utc_now.astimezone()
     return local_now.isoformat(timespec='seconds')
 
@@ -178,31 +183,14 @@ def get_utc_offset_hours() -> float:
     else:
         return 0
 
-def chat_recurring_prompt(state: AgentState) -> list[AnyMessage]:
-    # Get relevant episodes
-    episode_info = ""
-    if args.database:
-        episodes = episodic_memory.similarity_search(query=state["messages"][-1].content, k=3, filter={"username": USERNAME})
-    else:
-        episodes = episodic_memory.similarity_search(query=state["messages"][-1].content, k=3)
-    if episodes: 
-        episode_info = "Below are episodes that describe how you responded to past queries. To find out about the current state of your fleet, do not rely on these episodes; execute the appropriate tool."
-        for episode in episodes:
-            episode_info += f"\n\nEpisode: {episode.page_content}"
-    # Get relevant memories
-    memory_info = ""
-    if args.database:
-        memories = semantic_memory.similarity_search(query=state["messages"][-1].content, k=3, filter={"username": USERNAME})
-    else:
-        memories = semantic_memory.similarity_search(query=state["messages"][-1].content, k=3)
-    if memories:
-        memory_info = "Below are memories that you have saved from the user."
-        for memory in memories:
-            memory_info += f"\n\nMemory: {memory.page_content}"
-    # Construct prompt
-    prompt = f"""
+# Static portions of the recurring prompts, built once per session
+DB_NODES_STR = ", ".join(DB_NODES)
+CELL_NODES_STR = ", ".join(CELL_NODES)
+UTC_OFFSET_HOURS = get_utc_offset_hours()
+
+CHAT_PROMPT_TEMPLATE = f"""
     You are ExaCopilot, an assistant designed to help a user administer an Exadata system.
-    The user's name is {USERNAME}. The user's fleet includes the following database (DB) nodes/servers: {", ".join(DB_NODES)}. The user's fleet includes the following cell/storage nodes/servers: {", ".join(CELL_NODES)}.
+    The user's name is {USERNAME}. The user's fleet includes the following database (DB) nodes/servers: {DB_NODES_STR}. The user's fleet includes the following cell/storage nodes/servers: {CELL_NODES_STR}.
     The nodes in the user's fleet are the only nodes you have access to. You can respond to queries about Exadata and Oracle, using tools as you see fit. When describing a long tool output, summarize concisely.
     Only use a tool if it makes sense to do so in response to a query. If you cannot complete a request, say so.
     Make sure you provide all of the appropriate arguments when calling tools. Do not call tools without the appropriate arguments.
@@ -211,31 +199,118 @@ def chat_recurring_prompt(state: AgentState) -> list[AnyMessage]:
     - Prefer the tool `rag_cot_search` for step-by-step how-tos, comprehensive guides, procedures, or troubleshooting requests (e.g., "how to", "guide", "document", "troubleshoot", "steps").
     - Prefer the tool `rag_standard_search` for quick fact lookup, short answers, citations, or simple one-off questions.
     - When in doubt between the two, choose `rag_cot_search` if the user asks for a document, plan, or multiple operations; choose `rag_standard_search` for simple lookups.
-    The time zone is {TZ_IDENTIFIER}, which is offset from UTC by {get_utc_offset_hours()}. The current time is {get_current_time()}. Keep the time in mind when executing tools.
+    The time zone is {TZ_IDENTIFIER}, which is offset from UTC by {UTC_OFFSET_HOURS}. The current time is {{current_time}}. Keep the time in mind when executing tools.
     
     If the user asks about conversation history, respond to the best of your ability. If appropriate, let the user know you only have access to recent messages and relevant memories.
     If the user asks you to save a memory or remember something, save it to your long-term memory using the save_memory tool.
     If the user asks you to delete a memory or forget something, remove it from your long-term memory using the delete_memory tool.
     Do not use tools to recall memories; relevant memories are automatically provided to you.
 
-    {memory_info}
+    {{memory_info}}
 
-    {episode_info}
+    {{episode_info}}
     """
-    return [{"role": "system", "content": prompt}] + state["messages"]
 
-def poll_recurring_prompt(state: AgentState) -> list[AnyMessage]:
-    # Construct prompt
-    prompt = f"""
+POLL_PROMPT_TEMPLATE = f"""
     You are ExaCopilot, an assistant designed to respond to queries about Exadata and a given fleet.
-    The fleet includes the following database (DB) nodes/servers: {", ".join(DB_NODES)}. The fleet includes the following cell/storage nodes/servers: {", ".join(CELL_NODES)}.
+    The fleet includes the following database (DB) nodes/servers: {DB_NODES_STR}. The fleet includes the following cell/storage nodes/servers: {CELL_NODES_STR}.
     The nodes in the fleet are the only nodes you have access to. You can respond to queries about Exadata and Oracle, using tools as you see fit.
     Only use a tool if it makes sense to do so in response to a query. If you cannot complete a request, say so.
     Make sure you provide all of the appropriate arguments when calling tools. Do not call tools without the appropriate arguments.
-    The time zone is {TZ_IDENTIFIER}, which is offset from UTC by {get_utc_offset_hours()}. The current time is {get_current_time()}. Keep the time in mind when executing tools.
+    The time zone is {TZ_IDENTIFIER}, which is offset from UTC by {UTC_OFFSET_HOURS}. The current time is {{current_time}}. Keep the time in mind when executing tools.
     """
+
+def search_long_term_memory(query: str) -> tuple[list[Document], list[Document]]:
+    """
+    Search episodic and semantic long-term memory for episodes and memories relevant to a query.
+    """
+    # Embed the query once for both memory searches
+    query_vector = embed_model.embed_query(query)
+    if args.database:
+        episodes = episodic_memory.similarity_search_by_vector(query_vector, k=3, filter={"username": USERNAME})
+        memories = semantic_memory.similarity_search_by_vector(query_vector, k=3, filter={"username": USERNAME})
+    else:
+        episodes = episodic_memory.similarity_search_by_vector(query_vector, k=3)
+        memories = semantic_memory.similarity_search_by_vector(query_vector, k=3)
+    return episodes, memories
+
+# Long-term memory searches started ahead of the prompt hook, keyed by query
+memory_searches: dict[str, asyncio.Task] = {}
+
+def prefetch_long_term_memory(query: str) -> None:
+    """
+    Start searching long-term memory for a query so the search overlaps with agent startup.
+    """
+    memory_searches[query] = asyncio.create_task(asyncio.to_thread(search_long_term_memory, query))
+
+async def chat_recurring_prompt(state: AgentState) -> list[AnyMessage]:
+    query = state["messages"][-1].content
+    # Use the prefetched search for this query if there is one
+    search = memory_searches.pop(query, None)
+    if search:
+        episodes, memories = await search
+    else:
+        episodes, memories = await asyncio.to_thread(search_long_term_memory, query)
+    # Get relevant episodes
+    episode_info = ""
+    if episodes: 
+        episode_info = "Below are episodes that describe how you responded to past queries. To find out about the current state of your fleet, do not rely on these episodes; execute the appropriate tool."
+        for episode in episodes:
+            episode_info += f"\n\nEpisode: {episode.page_content}"
+    # Get relevant memories
+    memory_info = ""
+    if memories:
+        memory_info = "Below are memories that you have saved from the user."
+        for memory in memories:
+            memory_info += f"\n\nMemory: {memory.page_content}"
+    # Construct prompt
+    prompt = CHAT_PROMPT_TEMPLATE.format(
+        current_time=get_current_time(),
+        memory_info=memory_info,
+        episode_info=episode_info
+    )
+    return [{"role": "system", "content": prompt}] + state["messages"]
+
+def poll_recurring_prompt(state: AgentState) -> list[AnyMessage]:
+    # Construct prompt
+    prompt = POLL_PROMPT_TEMPLATE.format(current_time=get_current_time())
     return [{"role": "system", "content": prompt}] + state["messages"]
 
+# Cache of LLM responses keyed on a hash of the exact prompt and model settings, since prompts that
+# differ only in a node name or attribute value must not share a response
+llm_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+LLM_CACHE_SIZE = 256
+LLM_CACHE_TTL = 600
+
+def llm_cache_key(model, text: str) -> str:
+    """
+    Hash a prompt together with the model and its settings.
+    """
+    settings = json.dumps([USERNAME, model.model_id, model.model_kwargs, text], sort_keys=True, default=str)
+    return hashlib.sha256(settings.encode()).hexdigest()
+
+async def cached_llm(model, prompt, use_cache: bool = True) -> str:
+    """
+    Invoke a model, reusing the response to an identical prompt if one was cached recently.
+    Prompts that depend on the live state of the fleet should bypass the cache with use_cache=False.
+    """
+    if not use_cache:
+        response = await model.ainvoke(prompt)
+        return response.content
+    text = prompt if isinstance(prompt, str) else "\n".join(prompt)
+    key = llm_cache_key(model, text)
+    now = time.time()
+    # Evict expired responses, which are the oldest since every entry has the same TTL
+    while llm_cache and next(iter(llm_cache.values()))[0] <= now:
+        llm_cache.popitem(last=False)
+    if key in llm_cache:
+        return llm_cache[key][1]
+    response = await model.ainvoke(prompt)
+    llm_cache[key] = (now + LLM_CACHE_TTL, response.content)
+    if len(llm_cache) > LLM_CACHE_SIZE:
+        llm_cache.popitem(last=False)
+    return response.content
+
 async def sampling_handler(
     messages: list[SamplingMessage],
     params: SamplingParams,
@@ -249,8 +324,7 @@ async def sampling_handler(
     for message in messages:
         content = message.content.text if hasattr(message.content, 'text') else str(message.content)
         conversation.append(f"{message.role}: {content}")
-    response = sampling_model.invoke(conversation)
-    return response.content
+    return await cached_llm(get_sampling_model(), conversation)
 
 SERVER = "server.py"
 if args.read_only:
@@ -284,6 +358,36 @@ client = Client(
     sampling_handler=sampling_handler
 )
 
+# Ensure every tool has a non-empty description to satisfy OCI tool schema
+def _ensure_tool_descriptions(ts):
+    sanitized = []
+    for t in ts:
+        try:
+            desc = getattr(t, "description", None)
+            name = getattr(t, "name", t.__class__.__name__)
+            if not desc or not str(desc).strip():
+                setattr(t, "description", f"{name} tool")
+        except Exception:
+            pass
+        sanitized.append(t)
+    return sanitized
+
+# Sanitized MCP tools, loaded once per process
+_tools_cache = None
+_tools_lock = asyncio.Lock()
+
+async def get_tools():
+    """
+    Load the MCP tools and sanitize their descriptions, reusing the result after the first call.
+    Must be called while the MCP client is connected.
+    """
+    global _tools_cache
+    async with _tools_lock:
+        if _tools_cache is None:
+            tools = await load_mcp_tools(client.session)
+            _tools_cache = _ensure_tool_descriptions(tools)
+    return _tools_cache
+
 # ==========
 # Chat agent
 # ==========
@@ -292,17 +396,19 @@ client = Client(
 checkpointer = InMemorySaver()
 
 # Trim short-term memory messages to the 10 most recent ones before each LLM call
+SHORT_TERM_MEMORY_SIZE = 10
+
 def pre_model_hook(state):
     messages = state["messages"]
-    trimmed_messages = trim_messages(
-        messages,
-        strategy="last",
-        token_counter=len,
-        max_tokens=10,
-        start_on=("system", "human"),
-        end_on=("tool", "human")
-    )
-    return {"llm_input_messages": trimmed_messages}
+    # End on a tool or human message
+    end = len(messages)
+    while end > 0 and not isinstance(messages[end - 1], (ToolMessage, HumanMessage)):
+        end -= 1
+    # Start on a system or human message
+    start = max(0, end - SHORT_TERM_MEMORY_SIZE)
+    while start < end and not isinstance(messages[start], (SystemMessage, HumanMessage)):
+        start += 1
+    return {"llm_input_messages": messages[start:end]}
 
 # Load long-term memory
 if args.database:
@@ -337,14 +443,91 @@ if args.database:
 else:
     # Load episodic long-term memory
     if os.path.exists(f"memory/episodic_memory_{USERNAME.lower()}.pkl"):
-        episodic_memory = InMemoryVectorStore.load(f"memory/episodic_memory_{USERNAME.lower()}.pkl", embedding=embed_model)
+        episodic_memory = MatrixVectorStore.load(f"memory/episodic_memory_{USERNAME.lower()}.pkl", embedding=embed_model)
     else:
-        episodic_memory = InMemoryVectorStore(embedding=embed_model)
+        episodic_memory = MatrixVectorStore(embedding=embed_model)
     # Load semantic long-term memory
     if os.path.exists(f"memory/semantic_memory_{USERNAME.lower()}.pkl"):
-        semantic_memory = InMemoryVectorStore.load(f"memory/semantic_memory_{USERNAME.lower()}.pkl", embedding=embed_model)
+        semantic_memory = MatrixVectorStore.load(f"memory/semantic_memory_{USERNAME.lower()}.pkl", embedding=embed_model)
     else:
-        semantic_memory = InMemoryVectorStore(embedding=embed_model)
+        semantic_memory = MatrixVectorStore(embedding=embed_model)
+
+# Long-term memory writes running in the background, kept so they can be awaited on quit
+memory_writes: set[asyncio.Task] = set()
+
+def _log_memory_write_error(task: asyncio.Task) -> None:
+    memory_writes.discard(task)
+    if not task.cancelled() and task.exception():
+        print(colored(f"\nError saving to long-term memory: {str(task.exception())}", "red"))
+
+def write_memory_in_background(coro) -> None:
+    """
+    Run a long-term memory write without blocking the chat turn.
+    """
+    task = asyncio.create_task(coro)
+    memory_writes.add(task)
+    task.add_done_callback(_log_memory_write_error)
+
+class BufferedMemoryWriter:
+    """
+    Buffer documents bound for a long-term memory store and add them in batches, so each batch
+    is embedded with a single call. A batch is written once it holds batch_size documents or
+    max_delay seconds after its first document. If a path is given, the store is dumped to it
+    after every write so a crash does not lose the session's memories.
+    """
+
+    def __init__(self, vector_store, path: str = None, batch_size: int = 16, max_delay: float = 2.0):
+        self.vector_store = vector_store
+        self.path = path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending: list[Document] = []
+        self._timer: asyncio.Task = None
+        self._lock = asyncio.Lock()
+
+    def add(self, document: Document) -> None:
+        self._pending.append(document)
+        if len(self._pending) >= self.batch_size:
+            write_memory_in_background(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+            self._timer.add_done_callback(_log_memory_write_error)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            await self.vector_store.aadd_documents(documents=batch)
+            self._persist()
+
+    async def delete(self, ids: list[str]) -> None:
+        async with self._lock:
+            await self.vector_store.adelete(ids=ids)
+            self._persist()
+
+    async def close(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        # Every write already persists the store, so only the pending batch needs writing
+        await self.flush()
+
+    def _persist(self) -> None:
+        if self.path:
+            self.vector_store.dump(self.path)
+
+if args.database:
+    episodic_writer = BufferedMemoryWriter(episodic_memory)
+    semantic_writer = BufferedMemoryWriter(semantic_memory)
+else:
+    episodic_writer = BufferedMemoryWriter(episodic_memory, path=f"memory/episodic_memory_{USERNAME.lower()}.pkl")
+    semantic_writer = BufferedMemoryWriter(semantic_memory, path=f"memory/semantic_memory_{USERNAME.lower()}.pkl")
 
 # Save an episode to long-term memory
 async def save_episode(response: str):
@@ -358,13 +541,14 @@ async def save_episode(response: str):
 
     {response}
     """
-    summary = await sampling_model.ainvoke(prompt)
-    if summary.content == "Unsuccessful episode.":
+    # Episodes always describe tool calls made against the live fleet, so bypass the cache
+    summary = await cached_llm(get_sampling_model(), prompt, use_cache=False)
+    if summary == "Unsuccessful episode.":
         return
     id = str(uuid.uuid4())
-    document = Document(id=id, page_content=summary.content, metadata={"username": USERNAME, "id": id})
+    document = Document(id=id, page_content=summary, metadata={"username": USERNAME, "id": id})
     # Save episode
-    episodic_memory.add_documents(documents=[document])
+    episodic_writer.add(document)
 
 # Tool to save a memory (separate from MCP tools but accessed in the same way)
 async def save_memory(memory: str) -> str:
@@ -379,8 +563,8 @@ async def save_memory(memory: str) -> str:
     """
     id = str(uuid.uuid4())
     document = Document(id=id, page_content=memory, metadata={"username": USERNAME, "id": id})
-    # Save memory
-    semantic_memory.add_documents(documents=[document])
+    # Save memory in the background so the turn does not wait on embedding and insertion
+    semantic_writer.add(document)
     return "Successfully saved memory."
 
 # Tool to delete a memory (separate from MCP tools but accessed in the same way)
@@ -409,235 +593,248 @@ async def delete_memory(memory: str) -> str:
     Candidate memories:
     {old_memories}
     """
-    llm_output = await sampling_model.ainvoke(prompt)
-    if llm_output.content == "Error: No memory found.":
-        return llm_output.content
-    id = llm_output.content
-    # Delete memory
-    semantic_memory.delete(ids=[id])
+    llm_output = await cached_llm(get_sampling_model(), prompt)
+    if llm_output == "Error: No memory found.":
+        return llm_output
+    id = llm_output
+    # A cached response may name a memory that is not among the current candidates
+    if id not in [doc.metadata["id"] for doc in docs]:
+        return "Error: No memory found."
+    # Delete memory in the background
+    write_memory_in_background(semantic_writer.delete(ids=[id]))
     return "Successfully deleted memory."
 
-# Chat loop
-async def chat(poll_proc, exit_event):
+# Stream modes for verbose and default output
+STREAM_MODES = {
+    True: ["debug", "updates"],
+    False: ["messages", "updates"]
+}
+
+# Colored text printed while streaming, rendered once
+TOOL_EXECUTED_TEMPLATE = colored("The tool {} was executed.", "yellow") + "\n"
+TOOL_OUTPUT_HEADER = colored("\n--- Tool Output ---", "cyan") + "\n"
+TOOL_OUTPUT_FOOTER = colored("--- End Tool Output ---\n", "cyan") + "\n"
+
+async def consume_stream(agent, message, config) -> tuple[list, bool]:
     """
-    Chat loop for agent to interact with user.
+    Stream the agent's response to a message, printing it according to the output mode.
+    Returns the graph updates that make up the episode and whether any tools were executed.
     """
-    async with client:
-        tools = await load_mcp_tools(client.session)
-        # Ensure every tool has a non-empty description to satisfy OCI tool schema
-        def _ensure_tool_descriptions(ts):
-            sanitized = []
-            for t in ts:
-                try:
-                    desc = getattr(t, "description", None)
-                    name = getattr(t, "name", t.__class__.__name__)
-                    if not desc or not str(desc).strip():
-                        setattr(t, "description", f"{name} tool")
-                except Exception:
-                    pass
-                sanitized.append(t)
-            return sanitized
-        tools = _ensure_tool_descriptions(tools)
-        # Create agent
-        agent = create_react_agent(
-            model=chat_model,
-            tools=tools + [save_memory, delete_memory],
-            checkpointer=checkpointer,
-            prompt=chat_recurring_prompt,
-            pre_model_hook=pre_model_hook,
-        )
-        config = {"configurable": {"thread_id": "1"}}
-        # Initial message
-        print(colored("ExaCopilot: ", "light_magenta"), end="")
-        chat_initial_prompt = "Welcome the user and introduce yourself. Let the user know what database and cell nodes you have access to."
-        if args.verbose:
-            # Verbose mode
-            async for chunk in agent.astream(
-                {"messages": [SystemMessage(chat_initial_prompt)]},
-                stream_mode="debug",
-                config=config
-            ):
-                print(chunk)
-            print("")
+    verbose = args.verbose
+    write = sys.stdout.write
+    response = []
+    tools_in_response = False
+    async for stream_mode, chunk in agent.astream(
+        {"messages": [message]},
+        stream_mode=STREAM_MODES[verbose],
+        config=config
+    ):
+        if stream_mode == "updates":
+            # Construct episode
+            if "pre_model_hook" not in chunk:
+                response.append(chunk)
+            if "tools" in chunk:
+                tools_in_response = True
+        elif verbose:
+            print(chunk)
         else:
-            # Default mode
-            async for chunk in agent.astream(
-                {"messages": [SystemMessage(chat_initial_prompt)]},
-                stream_mode="messages",
-                config=config
-            ):
-                print(chunk[0].content, end="")
-            print("\n")
-        while True:
-            try:
-                query = input(colored("You: ", "light_cyan"))
-                if len(query) == 0:
-                    continue
-                elif query.lower() == 'quit':
-                    # Quit ExaCopilot
-                    if args.database:
-                        conn.close()
-                    else:
-                        episodic_memory.dump(f"memory/episodic_memory_{USERNAME.lower()}.pkl")
-                        semantic_memory.dump(f"memory/semantic_memory_{USERNAME.lower()}.pkl")
-                    if poll_proc:
-                        exit_event.set()
-                        print(colored("\nWaiting for polling of current node to finish...", "yellow"))
-                    sys.exit(0)
-                print(colored("\nExaCopilot: ", "light_magenta"), end="")
-                if args.verbose:
-                    # Verbose mode
-                    response = []
-                    tools_in_response = False
-                    async for stream_mode, chunk in agent.astream(
-                        {"messages": [HumanMessage(content=query)]},
-                        stream_mode=["debug", "updates"],
-                        config=config
+            message_chunk, metadata = chunk
+            if isinstance(message_chunk, ToolMessage):
+                name = message_chunk.name
+                write(TOOL_EXECUTED_TEMPLATE.format(name))
+                # For RAG tools or when debug/error info is present, echo tool output
+                try:
+                    tool_output = message_chunk.content or ""
+                    if (
+                        (isinstance(name, str) and name.startswith("rag_"))
+                        or (isinstance(tool_output, str) and ("DEBUG INFO" in tool_output or "ERROR INFO" in tool_output))
                     ):
-                        if stream_mode == "debug":
-                            print(chunk)
-                        else:
-                            # Construct episode
-                            if "pre_model_hook" not in chunk:
-                                response.append(chunk)
-                            if "tools" in chunk:
-                                tools_in_response = True             
-                    if tools_in_response:
-                        # Summarize and save the episode
-                        await save_episode(str(response))
-                    print("")
+                        write(TOOL_OUTPUT_HEADER)
+                        print(tool_output)
+                        write(TOOL_OUTPUT_FOOTER)
+                    else:
+                        write("\n")
+                except Exception:
+                    write("\n")
+                sys.stdout.flush()
+            elif metadata["langgraph_node"] == "agent":
+                if 'finish_reason' in message_chunk.additional_kwargs:
+                    write(f"{message_chunk.content}\n\n")
+                    sys.stdout.flush()
                 else:
-                    # Default mode
-                    response = []
-                    tools_in_response = False
-                    async for stream_mode, chunk in agent.astream(
-                        {"messages": [HumanMessage(content=query)]},
-                        stream_mode=["messages", "updates"],
-                        config=config
-                    ):
-                        if stream_mode == "messages":
-                            if isinstance(chunk[0], ToolMessage):
-                                print(colored("The tool " + chunk[0].name + " was executed.", "yellow"))
-                                # For RAG tools or when debug/error info is present, echo tool output
-                                try:
-                                    tool_output = chunk[0].content or ""
-                                    name = getattr(chunk[0], "name", "")
-                                    if (
-                                        (isinstance(name, str) and name.startswith("rag_"))
-                                        or (isinstance(tool_output, str) and ("DEBUG INFO" in tool_output or "ERROR INFO" in tool_output))
-                                    ):
-                                        print(colored("\n--- Tool Output ---", "cyan"))
-                                        print(tool_output)
-                                        print(colored("--- End Tool Output ---\n", "cyan"))
-                                    else:
-                                        print("")
-                                except Exception:
-                                    print("")
-                            elif chunk[1]["langgraph_node"] == "agent":
-                                if 'finish_reason' in chunk[0].additional_kwargs:
-                                    print(chunk[0].content)
-                                    print("")
-                                else:
-                                    print(chunk[0].content, end="")
-                        else:
-                            # Construct episode
-                            if "pre_model_hook" not in chunk:
-                                response.append(chunk)
-                            if "tools" in chunk:
-                                tools_in_response = True
-                    if tools_in_response:
-                        # Summarize and save the episode
-                        await save_episode(str(response))
-            except Exception as e:
-                print(colored(f"\nError in user chat: {str(e)}", "red"))
-                print(colored(traceback.format_exc(), "red"))
-
-def run_chat(poll_proc, exit_event):
-    return asyncio.run(chat(poll_proc, exit_event))
+                    write(message_chunk.content)
+    return response, tools_in_response
+
+async def read_input(prompt: str) -> str:
+    """
+    Read a line of user input without blocking the event loop.
+    input() runs on a daemon thread rather than the default executor, so exiting never waits for the user to press Enter.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    def read():
+        try:
+            result = input(prompt)
+            deliver = lambda: future.done() or future.set_result(result)
+        except BaseException as e:
+            deliver = lambda: future.done() or future.set_exception(e)
+        try:
+            loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            # The event loop closed while waiting for input
+            pass
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+# Chat loop
+async def chat(poll_task, exit_event):
+    """
+    Chat loop for agent to interact with user.
+    """
+    tools = await get_tools()
+    # Create agent
+    agent = create_react_agent(
+        model=get_chat_model(),
+        tools=tools + [save_memory, delete_memory],
+        checkpointer=checkpointer,
+        prompt=chat_recurring_prompt,
+        pre_model_hook=pre_model_hook,
+    )
+    config = {"configurable": {"thread_id": "1"}}
+    # Initial message
+    print(colored("ExaCopilot: ", "light_magenta"), end="")
+    chat_initial_prompt = "Welcome the user and introduce yourself. Let the user know what database and cell nodes you have access to."
+    await consume_stream(agent, SystemMessage(chat_initial_prompt), config)
+    if args.verbose:
+        print("")
+    while True:
+        try:
+            # Read input off the event loop so poll and background tasks keep running
+            query = await read_input(colored("You: ", "light_cyan"))
+            if len(query) == 0:
+                continue
+            elif query.lower() == 'quit':
+                # Quit ExaCopilot
+                # Finish pending long-term memory writes before persisting memory
+                if memory_writes:
+                    await asyncio.gather(*memory_writes, return_exceptions=True)
+                # Write any buffered memories, which also persists memory files
+                await episodic_writer.close()
+                await semantic_writer.close()
+                if args.database:
+                    conn.close()
+                if poll_task:
+                    exit_event.set()
+                    print(colored("\nWaiting for polling of current node to finish...", "yellow"))
+                return
+            # Search long-term memory while the agent starts up
+            prefetch_long_term_memory(query)
+            print(colored("\nExaCopilot: ", "light_magenta"), end="")
+            response, tools_in_response = await consume_stream(agent, HumanMessage(content=query), config)
+            if tools_in_response:
+                # Summarize and save the episode in the background
+                write_memory_in_background(save_episode(str(response)))
+            if args.verbose:
+                print("")
+        except Exception as e:
+            print(colored(f"\nError in user chat: {str(e)}", "red"))
+            print(colored(traceback.format_exc(), "red"))
 
 # ==========
 # Poll agent
 # ==========
 
+# Maximum number of nodes whose queries are answered concurrently
+POLL_CONCURRENCY = 4
+
 # Write Q&A history to exadata_qa file
 def write_to_file(
+    file: TextIO,
     node_type: str,
     query: str,
     response: str
 ) -> None:
     node_name = query.split(" ", 1)[0][:-1]
     query = query.split(" ", 1)[1].replace("\"", "").strip()
-    with open(EXADATA_QA_PATH, 'a') as file:
-        print(f"\n{node_name} ({node_type} node): " + query, file=file)
-        print("\nExaCopilot: " + response, file=file)
+    print(f"\n{node_name} ({node_type} node): " + query, file=file)
+    print("\nExaCopilot: " + response, file=file)
+
+# Translation table that deletes single and double quotes
+_QUOTE_TBL = str.maketrans('', '', '\'"')
 
 # Remove quotes from a string since node attribute values cannot have quotes
+@functools.lru_cache(maxsize=1024)
 def remove_quotes(
     text: str
 ) -> str:
-    text = contractions.fix(text)
-    text = "".join(text.split('\''))
-    text = "".join(text.split('\"'))
-    return text
+    return contractions.fix(text).translate(_QUOTE_TBL)
 
 # Poll loop
 async def poll(exit_event):
     """
     Poll loop for agent to interact with Exadata.
     """
-    async with client:
-        tools = await load_mcp_tools(client.session)
-        # Ensure every tool has a non-empty description for OCI chat tool schema
-        def _ensure_tool_descriptions(ts):
-            sanitized = []
-            for t in ts:
-                try:
-                    desc = getattr(t, "description", None)
-                    name = getattr(t, "name", t.__class__.__name__)
-                    if not desc or not str(desc).strip():
-                        setattr(t, "description", f"{name} tool")
-                except Exception:
-                    pass
-                sanitized.append(t)
-            return sanitized
-        tools = _ensure_tool_descriptions(tools)
-        # Create agent
-        agent = create_react_agent(
-            model=chat_model,
-            tools=tools,
-            prompt=poll_recurring_prompt
-        )
+    tools = await get_tools()
+    # Create agent
+    agent = create_react_agent(
+        model=get_chat_model(),
+        tools=tools,
+        prompt=poll_recurring_prompt
+    )
+    # Limit concurrent LLM calls to respect provider rate limits
+    semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+    async def _poll_one(node, node_type):
+        """
+        Answer the query from a single node.
+        """
+        async with semaphore:
+            if exit_event.is_set():
+                return None
+            query = await get_query(node, node_type)
+            response = await agent.ainvoke({"messages": [{"role": "user", "content": query}]})
+            response = response['messages'][-1].content
+            return query, remove_quotes(response)
+    nodes = [(node, "dbserver", "database") for node in DB_NODES] + [(node, "cell", "cell") for node in CELL_NODES]
+    # Keep the Q&A history file open for the lifetime of the poll loop (line-buffered)
+    with open(EXADATA_QA_PATH, 'a', buffering=1) as qa_file:
         while True:
-            # Poll each node in turn
-            for node in DB_NODES:
-                if exit_event.is_set():
-                    sys.exit(0)
-                try:
-                    query = get_query(node, "dbserver")
-                    response = await agent.ainvoke({"messages": [{"role": "user", "content": query}]})
-                    response = response['messages'][-1].content
-                    response = remove_quotes(response)
-                    set_response(node, "dbserver", response)
-                    write_to_file("database", query, response)
-                except Exception as e:
-                    print(colored(f"\nError in Exadata chat: {str(e)}", "red"))
-                    print(colored(traceback.format_exc(), "red"))
-            for node in CELL_NODES:
-                if exit_event.is_set():
-                    sys.exit(0)
+            if exit_event.is_set():
+                return
+            # Poll all nodes concurrently
+            results = await asyncio.gather(
+                *[_poll_one(node, node_type) for node, node_type, _ in nodes],
+                return_exceptions=True
+            )
+            # Set responses in node order, so the Q&A history file stays ordered
+            for (node, node_type, file_node_type), result in zip(nodes, results):
+                if result is None:
+                    continue
                 try:
-                    query = get_query(node, "cell")
-                    response = await agent.ainvoke({"messages": [{"role": "user", "content": query}]})
-                    response = response['messages'][-1].content
-                    response = remove_quotes(response)
-                    set_response(node, "cell", response)
-                    write_to_file("cell", query, response)
+                    if isinstance(result, Exception):
+                        raise result
+                    query, response = result
+                    await set_response(node, node_type, response)
+                    write_to_file(qa_file, file_node_type, query, response)
                 except Exception as e:
                     print(colored(f"\nError in Exadata chat: {str(e)}", "red"))
                     print(colored(traceback.format_exc(), "red"))
 
-def run_poll(exit_event):
-    return asyncio.run(poll(exit_event))
+async def run_agents(poll_enabled):
+    """
+    Run the chat agent and, if enabled, the poll agent as tasks sharing one MCP client.
+    """
+    exit_event = asyncio.Event()
+    async with client:
+        poll_task = None
+        if poll_enabled:
+            poll_task = asyncio.create_task(poll(exit_event))
+        try:
+            await chat(poll_task, exit_event)
+        finally:
+            # Stop polling once the chat ends, letting the current round finish
+            if poll_task:
+                exit_event.set()
+                await poll_task
 
 # ====
 # Main
@@ -648,20 +845,15 @@ def main():
     workarounds.msgpack_patch()
     workarounds.tools_patch()
     workarounds.stream_patch()
-    # Execute chat and poll in separate processes
-    poll_proc = None
-    exit_event = None
+    # Execute chat and poll as concurrent tasks in one event loop
+    poll_enabled = False
     if args.poll:
         # Check that Q&A attributes exist on nodes
         print(colored("Checking that Q&A attributes exist on nodes...\n", "yellow"))
-        supported = polling_supported()
-        if supported:
-            exit_event = multiprocessing.Event()
-            poll_proc = multiprocessing.Process(target=run_poll, args=(exit_event,))
-            poll_proc.start()
-        else:
+        poll_enabled = asyncio.run(polling_supported())
+        if not poll_enabled:
             print(colored("The fleet does not support the Q&A attributes for polling. ExaCopilot will continue without polling.\n", "yellow"))
-    run_chat(poll_proc, exit_event)
+    asyncio.run(run_agents(poll_enabled))
 
 if __name__ == "__main__":
     main()
@@ -165,9 +165,19 @@ import glob
 import tempfile
 import getpass
 from optparse import OptionParser
-import io
 import subprocess
 import base64
+import shlex
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+try:
+    from shlex import quote as shellQuote
+except ImportError:
+    # Python 2
+    from pipes import quote as shellQuote
 
 # dcli version displayed with --version
 version = "3.5"
@@ -202,6 +212,57 @@ SSH_OPTION_SERVERALIVECOUNTMAX="-o ServerAliveCountMax=5"
 # that the SSH client will wait for a connection to be established before
 # giving up. User is able to customize by option -ctimeout.
 SSH_OPTION_CONNECTTIMEOUT="-o ConnectTimeout="
+# Seconds an idle multiplexing master connection stays open. Masters are
+# closed explicitly when a cell's work is done; this only bounds leftovers.
+CONTROL_PERSIST_SECONDS = 60
+# most concurrent DNS lookups when resolving hosts to retry
+MAX_RESOLVER_THREADS = 32
+# host lists built by buildCellList, keyed by its arguments and group file
+# modification time; cleared when it reaches CELL_LIST_CACHE_SIZE entries
+CELL_LIST_CACHE = {}
+CELL_LIST_CACHE_SIZE = 64
+# file descriptor limit cached by get_file_descriptor_limit
+FD_LIMIT = None
+FD_LIMIT_CHECKED = False
+# option parser shared by calls to main, see getParser
+PARSER = None
+PARSER_LOCK = threading.Lock()
+# subdirectory of ~/.ssh holding masters kept by --control-persist
+CONTROL_SUBDIR = "dcli_ctl"
+# ssh warning for a host key that no longer matches known_hosts
+OFFENDING_KEY_RE = re.compile(r"Offending (?:ECDSA )?key")
+# a command already enclosed in single or double quotes, possibly multi-line
+QUOTED_COMMAND_RE = re.compile(r"^('.*'|\".*\")$", re.DOTALL)
+# characters that need a shell to expand or interpret them; quotes and
+# backslashes are not listed since shlex handles them like the shell does
+SHELL_SPECIAL_CHARS = frozenset("$`~*?[]{}();&|<>\n")
+# vmstat options that do not produce periodic statistics
+VMSTAT_NONPERIODIC_OPTIONS = frozenset(["-f", "-s", "-m", "-p", "-D", "-d",
+                                        "-V"])
+# Stack size for each per-host work thread. The threads only wait on ssh/scp
+# children, so a small stack lets many hosts run in parallel without reserving
+# the default 8MB of stack per thread.
+WORK_THREAD_STACK_SIZE = 512 * 1024
+# options that give dcli work to do without a command
+ACTION_OPTIONS = ("list", "exec_file", "file", "pushKey", "konepw", "dropKey")
+# actions that set up or remove ssh keys
+KEY_OPTIONS = frozenset(["pushKey", "konepw", "dropKey"])
+# (label, option dest) pairs listed by -v, in display order
+VERBOSE_OPTIONS = (("cells", "cells"), ("connectRamp", "connectRamp"),
+                   ("controlPersist", "controlPersist"),
+                   ("ctimeout", "ctimeout"), ("destfile", "destfile"),
+                   ("file", "file"), ("group", "groupfile"),
+                   ("hideStderr", "hideStderr"),
+                   ("rootWithExaTmp", "rootWithExaTmp"),
+                   ("maxLines", "maxLines"), ("maxThds", "maxThds"),
+                   ("listNegatives", "listNegatives"), ("pushKey", "pushKey"),
+                   ("konepw", "konepw"), ("regexp", "regexp"),
+                   ("sshOptions", "sshOptions"),
+                   ("showBanner", "showBanner"),
+                   ("scpOptions", "scpOptions"), ("dropKey", "dropKey"),
+                   ("serializeOps", "serializeOps"), ("userID", "userID"),
+                   ("verbosity", "verbosity"), ("vmstatOps", "vmstatOps"),
+                   ("exec_file", "exec_file"))
 
 # Error class used to handle environment errors (e.g. file not found)
 class Error(Exception):
@@ -224,17 +285,32 @@ def buildCellList(cells, filename):
     is assumed to be a cell.
     Unique cells are added to a list.
     Returns the list of unique cells.
+
+    Results are cached by cells, filename and the file's modification time,
+    so repeated calls to main in one process do not re-read a group file
+    that has not changed.
     """
-    celllist = []
     if filename :
         filename = filename.strip()
         try :
-            fd = open(filename)
-            lines = fd.readlines()
-            for line in lines :
-                line = line.strip()
-                if len(line) > 0 and not line.startswith("#") :
-                    celllist.append(line)
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            # let open below report the error
+            mtime = None
+    else:
+        mtime = None
+    key = (tuple(cells or ()), filename, mtime)
+    if mtime is not None or not filename:
+        cached = CELL_LIST_CACHE.get(key)
+        if cached is not None:
+            return list(cached)
+
+    celllist = []
+    if filename :
+        try :
+            with open(filename) as fd:
+                celllist = [line for line in (l.strip() for l in fd)
+                            if line and line[0] != "#"]
         except IOError as err:
             raise Error("I/O error(%s) on %s: %s" %
                         (err.errno, filename, err.strerror))
@@ -245,13 +321,35 @@ def buildCellList(cells, filename):
             for cell in cellSplit :
                 celllist.append(cell.strip())
 
+    # keep the first occurrence of each cell; the set makes lookups O(1)
     uniqueCellList = []
+    seenCells = set()
     for c in celllist :
-        if c not in uniqueCellList:
+        if c not in seenCells:
+            seenCells.add(c)
             uniqueCellList.append(c)
+    if len(CELL_LIST_CACHE) >= CELL_LIST_CACHE_SIZE:
+        CELL_LIST_CACHE.clear()
+    CELL_LIST_CACHE[key] = tuple(uniqueCellList)
     return uniqueCellList
 
 
+def isIPv6Address( host ):
+    """
+    Return true if host is an IPv6 address.
+
+    Host names and IPv4 addresses never contain ':', so they are rejected
+    without calling inet_pton and handling its error.
+    """
+    if ":" not in host:
+        return False
+    try:
+        socket.inet_pton(socket.AF_INET6, host)
+        return True
+    except socket.error:
+        # not a v6 address
+        return False
+
 def buildCommand( args, options ):
     """
     Build a command string to be sent to all hosts.
@@ -265,31 +363,53 @@ def buildCommand( args, options ):
     seconds for the whole command. It will stop all ongoing work;
     previous output will be retained.
     """
-    command = "("
+    parts = ["("]
     if options.rootWithExaTmp:
-        command += "cd "+ EXA_TMP_DIR+ ";"
+        parts.append("cd "+ EXA_TMP_DIR+ ";")
     if args:
         for word in args:
-            command += " " + word
+            parts.append(" " + word)
     if options.hideStderr:
-       command += ") 2>/dev/null"
+       parts.append(") 2>/dev/null")
     else:
-       command += ") 2>&1"
+       parts.append(") 2>&1")
+    command = "".join(parts)
     if options.timeout:
        # we assume all nodes support POSIX system (Including Linux).
-       command = "timeout %ss /bin/sh -c '(%s)'" % (options.timeout, command)
+       # The timeout runs on the remote node so the remote work is stopped,
+       # not just the local ssh. The command is already a subshell, so it is
+       # not wrapped in another one, and it is quoted to survive sh -c.
+       command = "timeout %ss /bin/sh -c %s" % (
+           options.timeout, shellQuote(command))
     return command
 
 def findFiles(path):
     '''Return list of files matching pattern in path.'''
 
-    file_list = []
+    # plain paths need no expansion or glob matching, only an existence check
+    if not any(c in path for c in "*?[$~"):
+        if os.path.lexists(path):
+            return [path]
+        return []
     path = os.path.expanduser(path)
     path = os.path.expandvars(path)
     file_list = glob.glob(path)
 
     return file_list
 
+def splitLines( text ):
+    """
+    Split text into lines that keep their newline, as readline() would.
+
+    Unlike str.splitlines, only newline characters end a line.
+    """
+    lines = text.split("\n")
+    last = lines.pop()
+    lines = [line + "\n" for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
 def checkFile( filepath, isExec ):
     """
     Test for existence and permissions of files to be copied or executed remotely.
@@ -302,16 +422,17 @@ def checkFile( filepath, isExec ):
        raise Error("File does not exist: %s" % filepath )
     else:
        for a_file in files:
-          if not os.path.exists(a_file):
+          # one stat call answers existence, type and permission checks
+          try:
+             mode = os.stat(a_file)[stat.ST_MODE]
+          except OSError:
              raise Error("File does not exist: %s" % a_file )
           if isExec:
-             if not os.path.isfile(a_file):
+             if not stat.S_ISREG(mode):
                 raise Error("Exec file is not a regular file: %s" % a_file )
-          elif not os.path.isfile(a_file) and not os.path.isdir(a_file):
+          elif not stat.S_ISREG(mode) and not stat.S_ISDIR(mode):
               raise Error("File is not a regular file or directory: %s" %
                           a_file )
-          st = os.stat(a_file)
-          mode = st[stat.ST_MODE]
           if isExec and os.name == "posix" and not (mode & stat.S_IEXEC):   # same as stat.S_IXUSR
              raise Error("Exec file does not have owner execute permissions")
 
@@ -350,8 +471,10 @@ def checkKeys(prompt, verbose):
                 subprocess.call(["ssh-keygen", "-t", "rsa"])
             else:
                 rsaPrivateKey = os.path.join(sshDir, "id_rsa")
-                subprocess.call(["ssh-keygen", "-t", "rsa", "-f", rsaPrivateKey,
-                                "-N", ""])
+                # one ssh-keygen run per user, ever; -q keeps its randomart
+                # out of the command output
+                subprocess.call(["ssh-keygen", "-q", "-t", "rsa", "-f",
+                                rsaPrivateKey, "-N", ""])
             if verbose:
                 print("An RSA key pair was generated.")
             # Load the newly generated key
@@ -369,6 +492,8 @@ class Session:
     def __init__(self):
         pass
     onepw = ""
+    # base64 encoding of onepw, set with onepw
+    onepw_b64 = ""
     testmode = ""
     exc = None
 
@@ -389,6 +514,23 @@ def  getOnePw():
 
     onepw = getpass.getpass("Password: ")
     Session.onepw = onepw
+    # bug 37793848: handle the password with special chars.
+    # Base64 encodes the password once for all cells
+    # for example, it will convert password '[]{}Aa1@#$%'
+    # to 'W117fUFhMUAjJCU='
+    if sys.version_info[0] < 3:
+        # Python 2: password type is bytes
+        # python 2 base64 encoding takes bytes as input and
+        # returns string.
+        Session.onepw_b64 = base64.b64encode(onepw)
+    else:
+        # Python 3: password type is string
+        # Python 3 base64 encoding takes bytes as input, so we
+        # first convert it to bytes;
+        # Python 3 base64 encoding returns bytes, so we
+        # decode the return to string in the end.
+        Session.onepw_b64 = base64.b64encode(
+                onepw.encode('utf-8')).decode('utf-8')
 
 def checkVmstat( vmstatOptions ):
     """
@@ -416,7 +558,7 @@ def checkVmstat( vmstatOptions ):
     vmstatCommand = "vmstat "
     vmOpts = vmstatOptions.split()
     for op in vmOpts:
-        if op in ("-f","-s","-m","-p","-D", "-d","-V"):
+        if op in VMSTAT_NONPERIODIC_OPTIONS:
             return None, None
 
         num = getInt(op)
@@ -499,69 +641,42 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
     connectTimeout = options.ctimeout
 
     files = list()
-    updateLock = threading.Lock()
     badCells = []
-    cells_need_retry = []
 
-    class WorkThread (threading.Thread):
+    class WorkThread (object):
         """
-        Command thread issues one command to one cell.
+        Command work issues one command to one cell.
 
-        one thread is created for each cell
-        allowing parallel operations.
+        one WorkThread is created for each cell and run by one of the
+        pool threads, allowing parallel operations.
         """
         def __init__( self, cell ):
-             threading.Thread.__init__(self)
              self.cell = cell
              self.child = None
              self.output_truncated = 0
+             # set when --timeout expired on streamed output
+             self.timedOut = False
+             # results, collected once all cells are done
+             self.status = None
+             self.output = None
+             # the cell could not be reached
+             self.bad = False
+             # the cell has an offending host key and should be retried
+             self.needsRetry = False
         def run(self):
             """
-            One thread for each WorkThread.start()
+            Run by a pool thread for each cell
             """
-            if verbose : print("...entering thread for %s:" % self.cell)
+            trace("...entering thread for %s:" % self.cell)
             childStatus = 0
             childInput = []
             childOutput = []
-            opString = " "
-            scpOpString = " "
-            if sshOptions:
-                opString += sshOptions + " "
-            if batchmode:
-                opString += "-o BatchMode=yes "
-            if strictHostKeyChecking:
-                opString += "-o strictHostKeyChecking=yes "
-            if connectTimeout:
-                opString += SSH_OPTION_CONNECTTIMEOUT +\
-                            str(connectTimeout) + " "
-            else:
-                opString += SSH_OPTION_CONNECTTIMEOUT +\
-                            str(DEFAULT_CONNECTION_TIMEOUT) + " "
-            # Add default ServerAliveInterval if not passed
-            if not sshOptions or \
-              sshOptions.lower().find("serveraliveinterval=") < 0 :
-                opString += SSH_OPTION_SERVERALIVEINTERVAL + " "
-            # Add default ServerAliveMaxCount if not passed
-            if not sshOptions or \
-              sshOptions.lower().find("serveralivecountmax=") < 0 :
-                opString += SSH_OPTION_SERVERALIVECOUNTMAX + " "
-            if scpOptions:
-                scpOpString += scpOptions + " "
-            else:
-                scpOpString = opString
-            if exec_file and scpOpString.find("-p") < 0 :
-                scpOpString += "-p "
-
             sshUser = ""
             scpHost = self.cell
             if files:
-                try:
-                    # check for ipv6 address, scp requires backets
-                    socket.inet_pton(socket.AF_INET6, scpHost)
+                # check for ipv6 address, scp requires backets
+                if isIPv6Address(scpHost):
                     scpHost = "[" + scpHost + "]"
-                except socket.error:
-                    # not a v6 address
-                    pass
             if user:
                 sshUser = "-l " + user + " "
                 scpHost = user + "@" + scpHost
@@ -580,23 +695,8 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                     SSHKEY[0] + "' >> .ssh/authorized_keys ; then chmod 644 .ssh/authorized_keys ;" + \
                     " echo ssh key added ; fi \""
                 if konepw:
-                    # bug 37793848: handle the password with special chars.
-                    # Base64 encodes the password
-                    # for example, it will convert password '[]{}Aa1@#$%'
-                    # to 'W117fUFhMUAjJCU='
-                    if sys.version_info[0] < 3:
-                        # Python 2: password type is bytes
-                        # python 2 base64 encoding takes bytes as input and
-                        # returns string.
-                        encoded_pw = base64.b64encode(Session.onepw)
-                    else:
-                        # Python 3: password type is string
-                        # Python 3 base64 encoding takes bytes as input, so we
-                        # first convert it to bytes; 
-                        # Python 3 base64 encoding returns bytes, so we
-                        # decode the return to string in the end.
-                        encoded_pw = base64.b64encode(
-                                Session.onepw.encode('utf-8')).decode('utf-8')
+                    # password was base64 encoded once by getOnePw
+                    encoded_pw = Session.onepw_b64
                     childInput = ["spawn -noecho " + sshCommand,
                                   "expect {",
                                   "\"Permission denied*\" { exit 255 }",
@@ -617,7 +717,8 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
 
                 if Session.testmode:
                     sshCommand = "echo " + sshCommand
-                childStatus, l = self.runCommand( sshCommand, True, childInput)
+                childStatus, l = self.runCommand( sshCommand, True, childInput,
+                                                  True)
                 childOutput.extend(l)
             
             # bug-37705638: Create destination directory on remote host
@@ -660,7 +761,8 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                 else:
                     sshCommand = SSH + opString + sshUser + self.cell + " " + command
 
-                childStatus, l = self.runCommand( sshCommand, serialize, None )
+                childStatus, l = self.runCommand( sshCommand, serialize, None,
+                                                  not commandQuoted )
                 childOutput.extend(l)
 
             if not childStatus and SSHKEY and dropKey:
@@ -679,27 +781,41 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                 childStatus, l = self.runCommand( sshCommand, serialize, None )
                 childOutput.extend(l)
 
-            updateLock.acquire()
-            status[self.cell] = childStatus
-            output[self.cell] = childOutput
-            updateLock.release()
-            if verbose : print("...exiting thread for %s status: %d" % (self.cell, childStatus))
+            if controlDir and not persistControl:
+                self.closeControlMaster(opString, sshUser)
+
+            self.status = childStatus
+            self.output = childOutput
+            trace("...exiting thread for %s status: %d" % (self.cell, childStatus))
             return
 
-        def runCommand( self, sshCommand, serialize, inputLines ):
+        def closeControlMaster( self, opString, sshUser ):
+            """
+            Stop the multiplexing master connection to the cell, if any.
+            """
+            devnull = open(os.devnull, 'w')
+            try:
+                subprocess.call(SSH + opString + "-O exit " + sshUser +
+                                self.cell, shell=True, stdin=devnull,
+                                stdout=devnull, stderr=devnull)
+            except OSError:
+                pass
+            devnull.close()
+
+        def runCommand( self, sshCommand, serialize, inputLines,
+                        shellNeeded=False ):
             """
             Run a command in a subprocess and return its status and output lines.
 
             Input command is string to be executed via ssh on each cell.
             Input serialize is true if serial execution required.
             Input lines are provided if the command will read input (e.g. expect)
+            Input shellNeeded is true if the command must be run by a shell
             ssh (or scp) command is run is a subprocess.  Stdout and stderr are
             collected.  This routine waits for completion of the subprocess and
             returns the completion code and any output lines.
             """
 
-            tmpBannerFile = ""
-            tmpBannerFd = None
             lwbanner = []
             banner_or_err = []
             def retry_if_needed(banner_or_err, stdout):
@@ -712,16 +828,9 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                 if not konepw:
                     return False
 
-                offend_key_exists = False
-                for line in banner_or_err:
-                    if "Offending key" in line or "Offending ECDSA key" in line:
-                        offend_key_exists = True
-                for line in stdout:
-                    if "Offending key" in line or "Offending ECDSA key" in line:
-                        offend_key_exists = True
-
-                if offend_key_exists:
-                    return True
+                for line in banner_or_err + stdout:
+                    if OFFENDING_KEY_RE.search(line):
+                        return True
                 return False
             # end of retry_if_needed
 
@@ -732,56 +841,72 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
             # in the end.
             if pushKey and not konepw and not inputLines:
                 try:
-                    # This bash command achieves three things:
-                    # 1. Runs SSH while preserving password prompts
-                    # 2. Adds hostname prefix to all output lines
-                    # 3. Preserves the original SSH exit status
-                    bash_command = "bash -c '" + \
-                        "{0}".format(
-                            sshCommand.replace(" 2>&1", "").replace("'",
-                                                                    "'\\''")
-                        ) + \
-                        " 1> >(sed \"s/^/" + \
-                        self.cell.replace('"', '\\"') + \
-                        ": /\") " + \
-                        "2> >(sed \"s/^/" + \
-                        self.cell.replace('"', '\\"') + \
-                        ": /\" >&2); " + \
-                        "exit ${PIPESTATUS[0]}'"
+                    # SSH prompts for the password on the terminal, while
+                    # its output is relayed as it arrives with the hostname
+                    # prefixed to each line.
+                    pushCommand = sshCommand.replace(" 2>&1", "")
+                    if controlDir:
+                        # Stderr is relayed from a pipe read to EOF, and a
+                        # persisted master would hold it open, so this ssh
+                        # must not become the master for later steps.
+                        pushCommand = pushCommand.replace(
+                            "-o ControlMaster=auto", "-o ControlMaster=no")
                     
-                    if verbose: print("execute: %s " % bash_command)
+                    trace("execute: %s " % pushCommand)
                     
-                    # Execute the command directly
-                    status = subprocess.call(bash_command, shell=True)
+                    child = subprocess.Popen(pushCommand, shell=True,
+                                             stdout=subprocess.PIPE,
+                                             stderr=subprocess.PIPE,
+                                             universal_newlines=True)
+                    self.child = child
+                    stderrRelay = threading.Thread(
+                        target=self.relayLines,
+                        args=(child.stderr, sys.stderr))
+                    stderrRelay.start()
+                    self.relayLines(child.stdout, sys.stdout)
+                    stderrRelay.join()
+                    status = child.wait()
                     
                     if status != 0:
                         # Authentication failed
-                        if self.cell not in badCells:
-                            badCells.append(self.cell)
+                        self.bad = True
                     
                     return status, []
             
                 except Exception as e:
-                    if verbose: print("Error executing SSH: %s" % str(e))
-                    if self.cell not in badCells:
-                        badCells.append(self.cell)
+                    trace("Error executing SSH: %s" % str(e))
+                    self.bad = True
                     return 1, []
             # End of execution with -k option enabled.
 
-            try:
-                tmpBannerFd, tmpBannerFile = tempfile.mkstemp(
-                    suffix="."+self.cell, prefix="banner_")
-            except OSError as e:
-                if e.errno == 24:
-                    print("Error: Too many hosts to execute command in parallel"
-                          ". Please rerun dcli with --batchsize option.")
-                else:
-                    raise
-                os._exit(1)
-            tmpFd = os.fdopen(tmpBannerFd, "r+")
-            sshCommand += " 2>"+tmpBannerFile
+            # Start ssh/scp directly instead of through a shell when the
+            # command line needs no shell processing
+            childArgv = None
+            if not shellNeeded:
+                childArgv = self.splitCommand(sshCommand)
+            if childArgv:
+                childCommand = childArgv
+            else:
+                childCommand = sshCommand
+            # Output is streamed when it would be truncated at maxLines
+            streamOutput = not (serialize or len(cells) == 1)
+            if controlDir or streamOutput:
+                # A ControlPersist master inherits stderr and older OpenSSH
+                # keeps it open after the client exits, so a pipe would not
+                # see EOF until the master is gone. Streamed output reads
+                # stdout alone, and a full stderr pipe (ssh -v or a noisy
+                # remote) would block the child. Use an unnamed file.
+                childStderr = tempfile.TemporaryFile(mode="w+")
+            else:
+                childStderr = subprocess.PIPE
+            # Only give the child a stdin pipe when there is input to send,
+            # so communicate() waits on the stdout pipe alone
+            if inputLines:
+                childStdin = subprocess.PIPE
+            else:
+                childStdin = devNull
 
-            if verbose : print("execute: %s " % sshCommand)
+            trace("execute: %s " % sshCommand)
             status = 0
 
             def execute_ssh_command():
@@ -789,19 +914,20 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                 isDefaultDecodingStandard = True
                 try:
                     if os.name == "posix":
-                        child = subprocess.Popen(sshCommand,
-                                                shell=True,
-                                                stdin=subprocess.PIPE,
+                        child = subprocess.Popen(childCommand,
+                                                shell=not childArgv,
+                                                stdin=childStdin,
                                                 stdout=subprocess.PIPE,
-                                                stderr=subprocess.PIPE,
+                                                stderr=childStderr,
                                                 universal_newlines=True,
-                                                close_fds=True)
+                                                close_fds=True,
+                                                **childSessionArgs)
                     else:
-                        child = subprocess.Popen(sshCommand,
-                                                shell=True,
-                                                stdin=subprocess.PIPE,
+                        child = subprocess.Popen(childCommand,
+                                                shell=not childArgv,
+                                                stdin=childStdin,
                                                 stdout=subprocess.PIPE,
-                                                stderr=subprocess.PIPE,
+                                                stderr=childStderr,
                                                 universal_newlines=True)
 
                     self.child = child
@@ -811,6 +937,31 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                             w.write(l + "\n")
                         w.flush()
 
+                    if streamOutput:
+                        # Read lines as they arrive, so a host that goes
+                        # over maxLines is cut off without buffering the
+                        # rest of its output
+                        if w is not None:
+                            w.close()
+                            w = None
+                        watchdog = None
+                        if options.timeout:
+                            # bound the wait as communicate(timeout=) does
+                            watchdog = threading.Timer(options.timeout + 2,
+                                                       self.expireChild,
+                                                       [child])
+                            watchdog.start()
+                        try:
+                            l = self.readNLines(
+                                iter(child.stdout.readline, ""), serialize)
+                        finally:
+                            if watchdog:
+                                watchdog.cancel()
+                        if self.timedOut:
+                            child.wait()
+                            sys.exit(1)
+                        return child, l, None
+
                 # Communicate will help identify if a child has ended due to
                 # timeout
 
@@ -835,41 +986,51 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
 
                     if (options.timeout and sys.version_info >= (3,3)):
                         try:
-                            stdout, _ = child.communicate(timeout
+                            stdout, stderr = child.communicate(timeout
                                                           =options.timeout+2)
                         except subprocess.TimeoutExpired:
+                            self.killChild(child)
                             sys.exit(1)
                     else:
-                        stdout, _ = child.communicate()
+                        stdout, stderr = child.communicate()
                 except UnicodeDecodeError:
                 # Attempt to decode with a fallback encoding (latin-1)
                     try:
+                        if streamOutput and child.poll() == None:
+                            # stop the streamed first attempt
+                            self.killChild(child)
+                        if childStderr is not subprocess.PIPE:
+                            # discard stderr of the first attempt
+                            childStderr.seek(0)
+                            childStderr.truncate()
                         if os.name == "posix":
-                            child = subprocess.Popen(sshCommand,
-                                                     shell=True,
-                                                     stdin=subprocess.PIPE,
+                            child = subprocess.Popen(childCommand,
+                                                     shell=not childArgv,
+                                                     stdin=childStdin,
                                                      stdout=subprocess.PIPE,
-                                                     stderr=subprocess.PIPE,
+                                                     stderr=childStderr,
                                                      universal_newlines=True,
                                                      close_fds=True,
-                                                     encoding="latin-1")
+                                                     encoding="latin-1",
+                                                     **childSessionArgs)
                         else:
-                            child = subprocess.Popen(sshCommand,
-                                                     shell=True,
-                                                     stdin=subprocess.PIPE,
+                            child = subprocess.Popen(childCommand,
+                                                     shell=not childArgv,
+                                                     stdin=childStdin,
                                                      stdout=subprocess.PIPE,
-                                                     stderr=subprocess.PIPE,
+                                                     stderr=childStderr,
                                                      universal_newlines=True,
                                                      encoding="latin-1")
 
                         if (options.timeout and sys.version_info >= (3,3)):
                             try:
-                                stdout, _ = child.communicate(timeout
+                                stdout, stderr = child.communicate(timeout
                                                           =options.timeout+2)
                             except subprocess.TimeoutExpired:
+                                self.killChild(child)
                                 sys.exit(1)
                         else:
-                            stdout, _ = child.communicate()
+                            stdout, stderr = child.communicate()
                         isDefaultDecodingStandard = False
                     except UnicodeDecodeError:
                         if verbose:
@@ -887,52 +1048,56 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                         raise
                     os._exit(1)
 
-                # Convert it to be compatible with readNLines.
                 # Python 2: Decode if necessary
                 if sys.version_info[0] < 3 and isinstance(stdout, str) \
                 and isDefaultDecodingStandard:
                     stdout = stdout.decode('utf-8')
-                r = io.StringIO(stdout)
-                l = self.readNLines(r, serialize)
+                l = self.readNLines(splitLines(stdout), serialize)
                 if w is not None:
                     w.close()
-                return child, l, r
+                return child, l, stderr
             # end of execute_ssh_command()
 
-            child, l, _ = execute_ssh_command()
-            status = child.wait()
-            banner_or_err = self.readBannerOrError(tmpFd)
-            tmpFd.close()
-            os.unlink(tmpBannerFile)
-            self.printBannerOrError(banner_or_err)
-
-            # Check if the command has timed out
-            # (return code 124 indicates timeout)
-            if child.returncode == 124:
-                l.append("Timeout expired for pid %d to %s...\n" % (child.pid,
-                         self.cell))
-            # regardless of returncode, if --key-with-one-password option
-            # exists and offending key warning exists, then retry.
-            elif retry_if_needed(banner_or_err, l):
-                cells_need_retry.append(self.cell)
-
-            elif child.returncode == 255:
-                badCells.append(self.cell)
-
+            child, l, stderr = execute_ssh_command()
 
             if self.output_truncated == 1 and child.poll() == None:
                 # stop child process since it is still running
                 sys.stderr.write("Killing child pid %d to %s...\n" %
                                  (child.pid, self.cell))
-                os.kill(child.pid, signal.SIGTERM)
+                signalChild(child, signal.SIGTERM)
                 t = 2.0  # max wait time in secs
                 while child.poll() == None:
                     if t > 0.4:
                         t -= 0.20
                         time.sleep(0.20)
                     else:  # still there, force kill
-                        os.kill(child.pid, signal.SIGKILL)
+                        signalChild(child, signal.SIGKILL)
                         break
+            if child.stdout is not None:
+                child.stdout.close()
+            if childStderr is not subprocess.PIPE:
+                status = child.wait()
+                childStderr.seek(0)
+                stderr = childStderr.read()
+                childStderr.close()
+            else:
+                child.stderr.close()
+                status = child.wait()
+            banner_or_err = splitLines(stderr)
+            self.printBannerOrError(banner_or_err)
+
+            # Check if the command has timed out
+            # (return code 124 indicates timeout)
+            if child.returncode == 124:
+                l.append("Timeout expired for pid %d to %s...\n" % (child.pid,
+                         self.cell))
+            # regardless of returncode, if --key-with-one-password option
+            # exists and offending key warning exists, then retry.
+            elif retry_if_needed(banner_or_err, l):
+                self.needsRetry = True
+
+            elif child.returncode == 255:
+                self.bad = True
 
             try:
                 if command:
@@ -952,23 +1117,59 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
             except OSError as e:
                 # os error 10 (no child process) is ok
                 if e.errno ==10:
-                    if verbose : print("No child process %d for wait" %
-                                       child.pid)
+                    trace("No child process %d for wait" % child.pid)
                 else:
                     raise
 
             return status, l
 
-        def readBannerOrError(self, bannerfd):
+        def relayLines(self, pipe, out):
             """
-             Read ssh or scp's stderr from a file.
-             bannerfd is the file descriptor of file into which
-             the banner or ssh/scp's stderr was written to
+            Copy lines from a child's pipe to out as they arrive, each
+            prefixed with the cell name.
             """
-            banner_or_err = []
-            for l in iter(bannerfd.readline,""):
-              banner_or_err.append(l)
-            return banner_or_err
+            for l in iter(pipe.readline, ""):
+                out.write(self.cell + ": " + l)
+                out.flush()
+            pipe.close()
+
+        def expireChild(self, child):
+            """
+            Kill a child whose streamed output is still open after the
+            --timeout grace period.
+            """
+            self.timedOut = True
+            try:
+                signalChild(child, signal.SIGKILL)
+            except OSError:
+                # already exited
+                pass
+
+        def killChild(self, child):
+            """
+            Kill a child, with its process group, and reap it.
+            """
+            try:
+                signalChild(child, signal.SIGKILL)
+            except OSError:
+                # already exited
+                pass
+            child.wait()
+
+        def splitCommand(self, sshCommand):
+            """
+             Split an ssh or scp command line built by dcli into an argument
+             list. Returns None if the command needs a shell: user supplied
+             ssh/scp options with shell syntax, test mode, or shell
+             expansions.
+            """
+            if (Session.testmode or userOptionsNeedShell or
+                "$" in sshCommand or "`" in sshCommand):
+                return None
+            try:
+                return shlex.split(sshCommand)
+            except ValueError:
+                return None
 
         def printBannerOrError(self, bannerOrError):
             """
@@ -992,11 +1193,12 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
             lines_with_banner.extend(r)
             return lines_with_banner
 
-        def readNLines(self, r, serialize):
+        def readNLines(self, lines, serialize):
             """
             Read up to maxLines; display output if max has been reached.
 
-            Input stdout pipe of child process.
+            Input lines of child process stdout, as a list or an iterator
+                  over its pipe.
             Input serialize is true if serial execution required.
             Input gets the banner of remote node. Contents are null by default
                   --showbanner option unhides the banner
@@ -1010,7 +1212,7 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
             else:
                 display_chunks = 0
 
-            for l in iter(r.readline, ""):
+            for l in lines:
                outputLines.append(l)
                i += 1
                if i > maxLines:
@@ -1040,23 +1242,52 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
                        break
             return outputLines
 
-        def isAlive(self):
-            """
-            Thread isAlive() wrapper to handle name change.
-            Starting in Python version 3.9, isAlive() becomes is_alive()
-            """
-            if sys.version_info >= (3,9):
-                return super(WorkThread,self).is_alive()
-            else:
-                return super(WorkThread,self).isAlive()
-
-
     #end of method and WorkThread class
 
     # Prepare and spawn threads to SSH to cells
     output = {}
     status = {}
-    waitList = []
+    workList = []
+    # Cells waiting for a pool thread, and a flag that stops the pool
+    # from taking any more of them after a keyboard interrupt
+    pendingCells = queue.Queue()
+    stopPool = threading.Event()
+    # Children that cannot prompt run in their own session, so signals
+    # reach anything a shell started for them, not only the shell
+    childSessionArgs = {}
+    if batchmode and os.name == "posix" and sys.version_info >= (3,2):
+        childSessionArgs["start_new_session"] = True
+
+    def signalChild(child, sig):
+        """
+        Send a signal to a child, and to its process group if it has one.
+        """
+        if childSessionArgs:
+            os.killpg(child.pid, sig)
+        else:
+            os.kill(child.pid, sig)
+
+    # shared stdin of children that take no input
+    devNull = open(os.devnull, "r")
+    # verbose messages from the work threads are queued and written by a
+    # single thread, so the workers never contend for stdout
+    traceQueue = queue.Queue()
+
+    def trace(message):
+        if verbose:
+            traceQueue.put(message)
+
+    def traceWriter():
+        while True:
+            message = traceQueue.get()
+            if message is None:
+                return
+            sys.stdout.write(message + "\n")
+
+    if verbose:
+        traceThread = threading.Thread(target=traceWriter)
+        traceThread.daemon = True
+        traceThread.start()
 
     if ((command or exec_file) and not Session.testmode and
         not os.path.exists(SSH)):
@@ -1112,102 +1343,274 @@ def copyAndExecute( cells, copyfiles, exec_file, destfile, command, options ) :
             else:
               command += " 2>&1"
 
-    # enclose command in single quotes so shell does not interpret arguments
-    # pre-existing single quotes must be escaped to survive
+    # quote the command so shell does not interpret arguments
     # if quotes aready exist then don't change it
-    if command and not (re.match("^'.*'$", command)
-                        or re.match("^\".*\"$", command)):
-        command = command.replace("'","'\\''")
-        command = "'" + command + "'"
+    # a command quoted here can be passed to ssh without a local shell
+    commandQuoted = False
+    if command and not QUOTED_COMMAND_RE.match(command):
+        command = shellQuote(command)
+        commandQuoted = True
+
+    # Multiplex ssh/scp to a cell over one connection when more than one
+    # connection would be made. When pushing keys, the password
+    # authenticated key push connection becomes the master, so the later
+    # steps to the cell reuse it instead of connecting again.
+    sshConnections = 0
+    for step in (SSHKEY and pushKey, destfile and destfile.endswith("/"),
+                 files, command, SSHKEY and dropKey):
+        if step:
+            sshConnections += 1
+    controlDir = None
+    controlPersist = CONTROL_PERSIST_SECONDS
+    # With --control-persist, masters are kept in a per-user directory
+    # after the run, so later dcli runs to the same cells reuse them.
+    persistControl = (options.controlPersist and not pushKey and
+                      not options.prompt and not Session.testmode)
+    if persistControl:
+        controlDir = os.path.join(os.path.expanduser("~"), SSHSUBDIR,
+                                  CONTROL_SUBDIR)
+        controlPersist = options.controlPersist
+        try:
+            os.makedirs(controlDir, stat.S_IRWXU)
+        except OSError:
+            # created earlier or by a concurrent run
+            if not os.path.isdir(controlDir):
+                raise
+    elif (sshConnections > 1 and not options.prompt
+          and not Session.testmode):
+        controlDir = tempfile.mkdtemp(prefix="dcli_ctl_")
+
+    # ssh and scp options are the same for every cell, so build them once
+    userOptionsNeedShell = False
+    for userOptions in (sshOptions, scpOptions):
+        if userOptions and not SHELL_SPECIAL_CHARS.isdisjoint(userOptions):
+            userOptionsNeedShell = True
+    opString = " "
+    scpOpString = " "
+    if sshOptions:
+        opString += sshOptions + " "
+    if batchmode:
+        opString += "-o BatchMode=yes "
+    if strictHostKeyChecking:
+        opString += "-o strictHostKeyChecking=yes "
+    if connectTimeout:
+        opString += SSH_OPTION_CONNECTTIMEOUT +\
+                    str(connectTimeout) + " "
+    else:
+        opString += SSH_OPTION_CONNECTTIMEOUT +\
+                    str(DEFAULT_CONNECTION_TIMEOUT) + " "
+    lowerSshOptions = (sshOptions or "").lower()
+    # Add default ServerAliveInterval if not passed
+    if "serveraliveinterval=" not in lowerSshOptions:
+        opString += SSH_OPTION_SERVERALIVEINTERVAL + " "
+    # Add default ServerAliveMaxCount if not passed
+    if "serveralivecountmax=" not in lowerSshOptions:
+        opString += SSH_OPTION_SERVERALIVECOUNTMAX + " "
+    if scpOptions:
+        scpOpString += scpOptions + " "
+    else:
+        scpOpString = opString
+    if exec_file and "-p" not in scpOpString:
+        scpOpString += "-p "
+    # Reuse one multiplexed connection for all ssh/scp steps to the
+    # host instead of a new connection and key exchange for each
+    if controlDir:
+        ctlOpString = "-o ControlMaster=auto -o ControlPath=" + \
+                      os.path.join(controlDir, "%r@%h:%p") + \
+                      " -o ControlPersist=" + \
+                      str(controlPersist) + "s "
+        opString += ctlOpString
+        scpOpString += ctlOpString
 
     def run_workThread(all_cells):
+        # A fixed pool of threads works through the cells, so at most
+        # maxThds ssh/scp children run at once and threads are reused
+        # instead of created per cell. Serial operation is a pool of one.
         for cell in all_cells:
-            cellThread = WorkThread( cell )
-            cellThread.start()
-            if serialize:
-                while cellThread.isAlive():
-                    cellThread.join(1)
-            else:
-                waitList.append(cellThread)
+            pendingCells.put(cell)
+
+        numWorkers = len(all_cells)
+        if serialize:
+            numWorkers = min(numWorkers, 1)
+        elif options.maxThds and options.maxThds < numWorkers:
+            numWorkers = options.maxThds
+        # the last worker to finish sets poolDone
+        poolDone = threading.Event()
+        runningWorkers = [numWorkers]
+        runningLock = threading.Lock()
+
+        def poolWorker():
+            try:
+                while not stopPool.is_set():
+                    try:
+                        cell = pendingCells.get_nowait()
+                    except queue.Empty:
+                        return
+                    work = WorkThread( cell )
+                    workList.append(work)
+                    try:
+                        work.run()
+                    except SystemExit:
+                        # a timed out cell ends its own work, not the worker
+                        pass
+            finally:
+                runningLock.acquire()
+                try:
+                    runningWorkers[0] -= 1
+                    if runningWorkers[0] == 0:
+                        poolDone.set()
+                finally:
+                    runningLock.release()
+
+        if numWorkers == 1:
+            # serial operation or a single cell needs no pool thread
+            poolWorker()
+            return
 
-        for thread in waitList:
-            #we must use time'd join to allow keyboard interrupt
-            while thread.isAlive():
-                thread.join(1)
+        for i in range(numWorkers):
+            if i and options.connectRamp:
+                # spread out the initial burst of connections
+                time.sleep(options.connectRamp)
+            poolThread = threading.Thread(target=poolWorker)
+            # the stack size is process wide and dcli may run inside a
+            # larger program, so only the pool threads get the small one
+            try:
+                oldStackSize = threading.stack_size(WORK_THREAD_STACK_SIZE)
+            except (ValueError, threading.ThreadError):
+                # platform does not allow changing the thread stack size
+                oldStackSize = None
+            try:
+                poolThread.start()
+            finally:
+                if oldStackSize is not None:
+                    threading.stack_size(oldStackSize)
+
+        #we must use time'd wait to allow keyboard interrupt
+        while runningWorkers[0]:
+            poolDone.wait(1)
         # end of run_workThread
 
+    def resolveHosts(hosts):
+        """
+        Resolve hosts to IP addresses in parallel, since each lookup may
+        wait on a slow resolver. Unresolved hosts are left out.
+        """
+        addresses = {}
+        pendingHosts = queue.Queue()
+        for host in hosts:
+            pendingHosts.put(host)
+
+        def resolver():
+            while True:
+                try:
+                    host = pendingHosts.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    addresses[host] = socket.gethostbyname(host)
+                except socket.gaierror as e:
+                    if verbose:
+                        print("Failed to resolve %s: %s" % (host, e))
+
+        resolvers = []
+        for i in range(min(len(hosts), MAX_RESOLVER_THREADS)):
+            resolverThread = threading.Thread(target=resolver)
+            resolverThread.start()
+            resolvers.append(resolverThread)
+        for resolverThread in resolvers:
+            resolverThread.join()
+        return addresses
+
     def remove_offending_keys(cells_need_retry):
         cells_able_to_retry = []
+        known_hosts_file = os.path.expanduser("~/.ssh/known_hosts")
+        try:
+            # read once; a stale copy only costs a no-op ssh-keygen run
+            with open(known_hosts_file, 'r') as f:
+                known_hosts_content = f.read()
+        except IOError:
+            if verbose:
+                print("known_hosts doesn't exist, no retry needed.")
+            return cells_able_to_retry
 
-        for cell in cells_need_retry:
-            returncode = -1
-            ip_address = None
-            devnull = None
-            is_able_to_retry = False
-            # Create to suppress both stdout and stderr when ssh-keygen -R
-            devnull = open(os.devnull, 'w')
-            known_hosts_file = os.path.expanduser("~/.ssh/known_hosts")
-            try:
-                ip_address = socket.gethostbyname(cell)
-            except socket.gaierror as e:
-                if verbose:
-                    print("Failed to resolve %s: %s" % (cell, e))
-            try:
-                with open(known_hosts_file, 'r') as f:
-                    known_hosts_content = f.read()
-
-                if cell in known_hosts_content:
-                    # Remove the offending entry from known_hosts
-                    returncode = subprocess.call(["ssh-keygen", "-R",
-                                                    cell],
-                                                    stdout=devnull,
-                                                    stderr=devnull)
-                    if returncode == 0 and verbose:
-                        print("Removed %s from known_hosts and retrying "\
-                                "command." % cell)
-                    is_able_to_retry = True
-                if ip_address and ip_address in known_hosts_content:
+        ip_addresses = resolveHosts(cells_need_retry)
+        # Create to suppress both stdout and stderr when ssh-keygen -R
+        devnull = open(os.devnull, 'w')
+        try:
+            for cell in cells_need_retry:
+                ip_address = ip_addresses.get(cell)
+                is_able_to_retry = False
+                hosts = [cell]
+                if ip_address and ip_address != cell:
+                    hosts.append(ip_address)
+                for host in hosts:
+                    if host not in known_hosts_content:
+                        continue
                     # Remove the offending entry from known_hosts
-                    returncode = subprocess.call(["ssh-keygen", "-R",
-                                                    ip_address],
-                                                    stdout=devnull,
-                                                    stderr=devnull)
+                    returncode = subprocess.call(["ssh-keygen", "-R", host],
+                                                 stdout=devnull,
+                                                 stderr=devnull)
                     if returncode == 0 and verbose:
                         print("Removed %s from known_hosts and retrying "\
-                                "command." % ip_address)
+                                "command." % host)
                     is_able_to_retry = True
                 if is_able_to_retry:
                     cells_able_to_retry.append(cell)
-
-            except IOError:
-                if verbose:
-                    print("known_hosts doesn't exist, no retry needed.")
-                pass
+        finally:
+            devnull.close()
         return cells_able_to_retry
 
 
     try:
         run_workThread(cells)
 
+        cells_need_retry = [work.cell for work in workList if work.needsRetry]
         if cells_need_retry:
             cells_to_retry = remove_offending_keys(cells_need_retry)
             run_workThread(cells_to_retry)
 
+        # collect results; a retried cell's later result replaces the first
+        for work in workList:
+            if work.status is not None:
+                status[work.cell] = work.status
+                output[work.cell] = work.output
+            if work.bad:
+                badCells.append(work.cell)
+
+        devNull.close()
+        if controlDir and not persistControl:
+            try:
+                os.rmdir(controlDir)
+            except OSError:
+                # a master connection may still be shutting down
+                pass
+        if verbose:
+            traceQueue.put(None)
+            traceThread.join()
+
 
     except KeyboardInterrupt:
         print("Keyboard interrupt")
-        for thread in waitList:
-            if thread.isAlive() and thread.child:
+        # keep the pool threads from starting children for the remaining
+        # cells, so only the children already running need killing
+        stopPool.set()
+        while True:
+            try:
+                pendingCells.get_nowait()
+            except queue.Empty:
+                break
+        for thread in workList:
+            if thread.child and thread.child.poll() == None:
                 try:
                     print("killing child pid %d..." % thread.child.pid)
-                    os.kill(thread.child.pid, signal.SIGTERM)
+                    signalChild(thread.child, signal.SIGTERM)
                     t = 2.0  # max wait time in secs
                     while thread.child.poll() == None:
                         if t > 0.4:
                             t -= 0.20
                             time.sleep(0.20)
                         else:  # still there, force kill
-                            os.kill(thread.child.pid, signal.SIGKILL)
+                            signalChild(thread.child, signal.SIGKILL)
                             time.sleep(0.4)
                             thread.child.poll() # final try
                             break
@@ -1239,35 +1642,39 @@ def listResults( cells, statusMap, outputMap, listNegatives, regexp,
     listNegatives option restricts output by listing only lines from
     cells which returned non-zero status from copy or command execution.
     regexp option restricts output by filtering-out lines which match a
-    regular expression.
+    regular expression, given as a pattern string or compiled.
     preserveSpaces option will preserve spaces at beginning of output lines.
     We print output in "cells" order which is order given in user group
     file and command line cell list.
     """
+    if regexp and not hasattr(regexp, "match"):
+        # callers that build their own options may pass the pattern string
+        regexp = re.compile(regexp)
+
     if listNegatives :
         okCells = []
         for cell in cells:
-            if cell in list(statusMap.keys()) and statusMap[cell] == 0:
+            if cell in statusMap and statusMap[cell] == 0:
                 okCells.append(cell)
         if len(okCells) > 0:
             print("OK: %s" % okCells)
 
-    compiledRE = None
     if regexp:
         reCells = []
-        compiledRE = re.compile(regexp)
         for cell in cells:
-            if cell in list(outputMap.keys()):
+            if cell in outputMap:
                 output = outputMap[cell]
                 for l in output:
-                    if compiledRE.match(l.strip()):
+                    if regexp.match(l.strip()):
                         reCells.append(cell)
                         break
         if len(reCells) > 0:
-            print("%s: %s" % (regexp, reCells))
+            print("%s: %s" % (regexp.pattern, reCells))
 
+    # collect the lines and write them at once rather than print each one
+    outputLines = []
     for cell in cells:
-        if cell in list(outputMap.keys()):
+        if cell in outputMap:
             if not listNegatives or statusMap[cell] > 0:
                 output = outputMap[cell]
                 for l in output:
@@ -1275,19 +1682,22 @@ def listResults( cells, statusMap, outputMap, listNegatives, regexp,
                     # OK!  pylint: disable=undefined-variable
                     if sys.version_info[0] < 3 and isinstance(l, unicode):
                       l = l.encode('utf-8')
-                    if not compiledRE or not compiledRE.match(l.strip()):
+                    if not regexp or not regexp.match(l.strip()):
                         if preserveSpaces:
-                            print("%s: %s" % (cell, l.rstrip()))
+                            outputLines.append("%s: %s\n" % (cell, l.rstrip()))
                         else:
-                            print("%s: %s" % (cell, l.strip()))
+                            outputLines.append("%s: %s\n" % (cell, l.strip()))
+    sys.stdout.write("".join(outputLines))
 
-def listVmstatHeader(headers, maxLenCellName, header1Widths, header2Widths):
+def listVmstatHeader(headers, maxLenCellName, header1Widths, header2Widths,
+                     timestamp):
     """
     print two vmstat headers aligned according to field widths
+    timestamp is the local time shown in front of the second header
     """
     print("%s %s" % (" ".rjust(maxLenCellName),
                      listVmstatLine(header1Widths, headers[0].split())))
-    print("%s:%s" %  (time.strftime('%X').rjust(maxLenCellName),
+    print("%s:%s" %  (timestamp.rjust(maxLenCellName),
                        listVmstatLine(header2Widths, headers[1].split())))
 
 def listVmstatLine( widths, values ):
@@ -1323,13 +1733,20 @@ def listVmstatResults( cells, outputMap, vmstatOps, count):
     total = []
 
     # use local time as max name width (it's used in header2)
-    maxLenCellName = len(time.strftime('%X'))
-    outputCount = len(list(outputMap.keys()))
-    for cell in list(outputMap.keys()):
+    timestamp = time.strftime('%X')
+    maxLenCellName = len(timestamp)
+    outputCount = len(outputMap)
+    # split each cell's last line once, for both the totals and the listing
+    rows = {}
+    headers = None
+    for cell in outputMap:
         if maxLenCellName < len(cell):
             maxLenCellName = len(cell)
         output = outputMap[cell]
+        if headers is None:
+            headers = output
         values = output[-1].split()
+        rows[cell] = values
         i = -1
         for v in values:
             i += 1
@@ -1357,14 +1774,13 @@ def listVmstatResults( cells, outputMap, vmstatOps, count):
     # if not -n then print the header each time
     # with -n we only print on first invocation
     if count == 0 or vmstatOps.find("-n") == -1 :
-        listVmstatHeader(list(outputMap.values())[0], maxLenCellName, header1Widths, fieldWidths )
+        listVmstatHeader(headers, maxLenCellName, header1Widths, fieldWidths,
+                         timestamp )
 
     # list the output in key order, followed by min, max, and average
     for cell in cells:
-        if cell in list(outputMap.keys()):
-            output = outputMap[cell]
-            values = output[-1].split()
-            print("%s:%s" % (cell.rjust(maxLenCellName), listVmstatLine(fieldWidths, values)))
+        if cell in rows:
+            print("%s:%s" % (cell.rjust(maxLenCellName), listVmstatLine(fieldWidths, rows[cell])))
 
     if outputCount > 1:
         print("%s:%s" % (MINIMUM.rjust(maxLenCellName), listVmstatLine(fieldWidths, minvalues)))
@@ -1376,44 +1792,65 @@ def listVmstatResults( cells, outputMap, vmstatOps, count):
 
 def get_file_descriptor_limit(verbose):
     """
-    Retrieve the current system file descriptor limit using the 'ulimit -n'
-    command.
+    Retrieve the file descriptor limit of this process. The limit is read
+    and raised by the first call only; later calls in the same process,
+    such as repeated calls to main, return the cached value.
 
     Args:
-        verbose (bool): If True, prints debug information about the command
-        output.
+        verbose (bool): If True, prints debug information about the limits.
 
     Returns:
-        int: The system file descriptor limit.
+        int: The file descriptor limit.
+             Returns None if retrieval fails.
+    """
+    global FD_LIMIT, FD_LIMIT_CHECKED
+    if not FD_LIMIT_CHECKED:
+        FD_LIMIT = read_file_descriptor_limit(verbose)
+        FD_LIMIT_CHECKED = True
+    elif verbose and FD_LIMIT is not None:
+        print("File descriptor limit: %d" % FD_LIMIT)
+    return FD_LIMIT
+
+def read_file_descriptor_limit(verbose):
+    """
+    Read the file descriptor limit of this process, first raising the
+    soft limit to the hard limit so that more cells can run in parallel.
+
+    Args:
+        verbose (bool): If True, prints debug information about the limits.
+
+    Returns:
+        int: The file descriptor limit.
              Returns None if retrieval fails.
     """
     try:
-        # Use bash explicitly to ensure consistent environment
-        process = subprocess.Popen(['bash', '-c', 'ulimit -n'],
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-        output, _ = process.communicate()
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError) as e:
+        if verbose:
+            print("Error getting file descriptor limit: %s" % str(e))
+        return None
 
-        if process.returncode != 0:
+    if soft != resource.RLIM_INFINITY and \
+       (hard == resource.RLIM_INFINITY or soft < hard):
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
             if verbose:
-                print("ulimit command failed")
-            return None
-
-        # Handle bytes vs string for Python 2 and 3
-        if isinstance(output, bytes):
-            output = output.decode('utf-8')
+                print("Raised file descriptor limit from %d to %d" %
+                      (soft, hard))
+            soft = hard
+        except (ValueError, OSError) as e:
+            # an unlimited hard limit may still exceed the kernel maximum
+            if verbose:
+                print("Unable to raise file descriptor limit: %s" % str(e))
 
-        # Clean the output and convert to integer
-        limit = int(str(output).strip())
+    if soft == resource.RLIM_INFINITY:
+        return None
 
-        if verbose:
-            print("Parsed ulimit value: %d" % limit)
+    if verbose:
+        print("File descriptor limit: %d" % soft)
 
-        return limit
-    except (OSError, ValueError) as e:
-        if verbose:
-            print("Error getting ulimit: %s" % str(e))
-        return None
+    return soft
 
 def update_max_threads(options):
     """
@@ -1421,7 +1858,7 @@ def update_max_threads(options):
 
     Uses 7 FDs per cell calculation:
     - 5 FDs for SSH (stdin, stdout, stderr, network socket, control socket)
-    - 1 FD for temporary banner file
+    - 1 FD for the stderr pipe
     - 1 FD buffer for safety
 
     Args:
@@ -1440,7 +1877,7 @@ def update_max_threads(options):
 
     # Calculate max threads based on FD limit
     # Reserve ~10 FDs for the Python process itself
-    FDS_PER_CELL = 7  # 5 for SSH + 1 for banner + 1 buffer
+    FDS_PER_CELL = 7  # 5 for SSH + 1 for stderr + 1 buffer
     RESERVED_FDS = 10
 
     max_threads = (fd_limit - RESERVED_FDS) // FDS_PER_CELL
@@ -1458,24 +1895,10 @@ def update_max_threads(options):
     return True
 
 
-def main(argv=None):
-
+def buildParser():
     """
-    Main program.
-
-    This builds the option handler and handles help and usage errors.
-    Then calls buildCommand to build the command to be sent.
-    Then calls buildCellList to build a list of cells to connect with.
-    Then calls copyAndExecute to send or execute commands to all cells.
-    Then calls listResults to optionally abbreviate and list output
-    Finally it returns 0, 1, or 2 based on results.
+    Build the option parser for main.
     """
-    if argv is None:
-        argv = sys.argv
-    elif argv[0].startswith("test"):
-        # tests cannot rely on ssh ports
-        Session.testmode = "test"
-
     usage = "usage: %prog [options] [command]"
     parser = OptionParser(usage=usage, add_help_option=False,
                           version="version %s" % version)
@@ -1486,6 +1909,16 @@ def main(argv=None):
     parser.add_option("-c",
                       action="append", type="string", dest="cells",
                       help="comma-separated list of hosts")
+    parser.add_option("--connect-ramp",
+                      action="store", type="float", dest="connectRamp",
+                      default=0,
+                      help="seconds to wait between starting connections to" +\
+                      " hosts, to avoid bursts of simultaneous connects")
+    parser.add_option("--control-persist",
+                      action="store", type="int", dest="controlPersist",
+                      default=0,
+                      help="seconds to keep ssh connections to hosts open" +\
+                      " after dcli exits, for reuse by later dcli runs")
     parser.add_option("--ctimeout",
                       action="store", type="int", dest="ctimeout",
                       help="Maximum time in seconds for initial host connect")
@@ -1585,45 +2018,60 @@ def main(argv=None):
 
     # stop parsing when we hit first arg to allow unquoted commands
     parser. disable_interspersed_args()
-    (options, args) = parser.parse_args(argv[1:])
+    return parser
+
+def getParser():
+    """
+    Return the option parser, built on first use and reused by later calls
+    to main, e.g. when dcli is imported and main is called per command.
+    """
+    global PARSER
+    if PARSER is None:
+        PARSER = buildParser()
+    return PARSER
+
+def main(argv=None):
+
+    """
+    Main program.
+
+    This builds the option handler and handles help and usage errors.
+    Then calls buildCommand to build the command to be sent.
+    Then calls buildCellList to build a list of cells to connect with.
+    Then calls copyAndExecute to send or execute commands to all cells.
+    Then calls listResults to optionally abbreviate and list output
+    Finally it returns 0, 1, or 2 based on results.
+    """
+    if argv is None:
+        argv = sys.argv
+    elif argv[0].startswith("test"):
+        # tests cannot rely on ssh ports
+        Session.testmode = "test"
+
+    parser = getParser()
+    # parse_args keeps its working state on the shared parser
+    PARSER_LOCK.acquire()
+    try:
+        (options, args) = parser.parse_args(argv[1:])
+    finally:
+        PARSER_LOCK.release()
 
     # split options.file if there are list items
     if options.file:
-       options_file=[]
-       for item_file in options.file:
-           options_file.extend(item_file.split())
-
-       options.file = options_file
+       options.file = [path for item_file in options.file
+                       for path in item_file.split()]
 
     # trim exec file option
     if options.exec_file:
        options.exec_file=options.exec_file.strip()
 
     if options.verbosity :
-        print('options.cells: %s' % options.cells)
-        print('options.ctimeout: %s' % options.ctimeout)
-        print('options.destfile: %s' % options.destfile)
-        print('options.file: %s' % options.file)
-        print('options.group: %s' % options.groupfile)
-        print('options.hideStderr: %s' % options.hideStderr)
-        print('options.rootWithExaTmp: %s' % options.rootWithExaTmp)
-        print('options.maxLines: %s' % options.maxLines)
-        if options.maxThds != 0:
-            print('options.maxThds: %s' % options.maxThds)
-        print('options.listNegatives: %s' % options.listNegatives)
-        print('options.pushKey: %s' % options.pushKey)
-        print('options.konepw: %s' % options.konepw)
-        print('options.regexp: %s' % options.regexp)
-        print('options.sshOptions: %s' % options.sshOptions)
-        print('options.showBanner: %s' % options.showBanner)
-        print('options.scpOptions: %s' % options.scpOptions)
-        print('options.dropKey: %s' % options.dropKey)
-        print('options.serializeOps: %s' % options.serializeOps)
-        print('options.userID: %s' % options.userID)
-        print('options.verbosity %s' % options.verbosity)
-        print('options.vmstatOps %s' % options.vmstatOps)
-        print('options.exec_file: %s' % options.exec_file)
-        print("argv: %s" % argv)
+        # maxThds is only listed when it was set
+        lines = ["options.%s: %s" % (label, getattr(options, dest))
+                 for label, dest in VERBOSE_OPTIONS
+                 if dest != "maxThds" or options.maxThds != 0]
+        lines.append("argv: %s" % argv)
+        print("\n".join(lines))
 
     returnValue = 0
     try:
@@ -1632,15 +2080,15 @@ def main(argv=None):
         if len(args) > 0:
             command = buildCommand( args, options )
 
-        if not command and not (options.list or options.exec_file
-                                or options.file or options.pushKey
-                                or options.konepw
-                                or options.dropKey
-                                or options.vmstatOps != None):
+        # look up the action options once for the checks below
+        actions = set(name for name in ACTION_OPTIONS
+                      if getattr(options, name))
+        copyActions = "exec_file" in actions or "file" in actions
+        if not command and not actions and options.vmstatOps is None:
             raise UsageError("No command specified.")
-        if command and options.exec_file:
+        if command and "exec_file" in actions:
             raise UsageError("Cannot specify both command and exec file")
-        if options.file and options.exec_file:
+        if "file" in actions and "exec_file" in actions:
             raise UsageError("Cannot specify both copy file and exec file")
 
         if (options.hideStderr) and (len(args) == 0):
@@ -1649,12 +2097,19 @@ def main(argv=None):
         if options.listNegatives and options.regexp:
             raise UsageError("Cannot specify both non-error and regular "\
                              "expression abbrevation options")
+        # compile once for every listResults call, including streamed output
+        if options.regexp:
+            try:
+                options.regexp = re.compile(options.regexp)
+            except re.error as err:
+                raise UsageError("Invalid regular expression %s: %s"
+                                 % (options.regexp, err))
         vmstatCount = None
         # an empty option value is is ok for vmstat
         if options.vmstatOps != None and options.vmstatOps == "":
             options.vmstatOps = " "
         if options.vmstatOps :
-            if (options.exec_file or options.file or command):
+            if (copyActions or command):
                 raise UsageError("Cannot specify vmstat option with copy file,"\
                                  " exec file, or command")
             if (options.listNegatives or options.regexp):
@@ -1663,8 +2118,13 @@ def main(argv=None):
             vmstatCount, command = checkVmstat(options.vmstatOps)
             if vmstatCount == None:
                 command = "vmstat " + options.vmstatOps
-        if (options.pushKey or options.konepw or options.dropKey):
+        if not actions.isdisjoint(KEY_OPTIONS):
             checkKeys(options.prompt, options.verbosity)
+        if options.connectRamp < 0:
+            raise UsageError("--connect-ramp value must be a positive number")
+        if options.controlPersist < 0:
+            raise UsageError("--control-persist value must be a positive"\
+                             " number")
         if options.ctimeout is not None:
             if options.ctimeout < 0:
                 raise UsageError("--ctimeout value must be a positive"\
@@ -1699,13 +2159,12 @@ def main(argv=None):
         if options.file:
            for item_file in options.file:
                checkFile(item_file, False )
-        if options.destfile and not (options.exec_file or options.file):
+        if options.destfile and not copyActions:
             raise UsageError("Cannot specify destination without copy file or exec file")
         if options.list:
             print("Target hosts: %s" % clist)
 
-        if (command or options.exec_file or options.file or
-            options.pushKey or options.konepw or options.dropKey):
+        if command or actions.difference(["list"]):
 
             if options.verbosity and len(clist) > 0 :
                 print("Connecting to hosts: %s" % clist)
@@ -1713,68 +2172,66 @@ def main(argv=None):
         if (options.konepw and len(clist) > 0 ):
             getOnePw()
         if len(clist) > 0 :
-            batchBegin = 0
+            # copyAndExecute runs at most maxThds hosts at a time, so
+            # only vmstat sampling needs to be split into batches here
+            if options.maxThds == 0 or vmstatCount is None:
+                batches = [(0, len(clist))]
+            else:
+                batches = [(i, min(i + options.maxThds, len(clist)))
+                           for i in range(0, len(clist), options.maxThds)]
             sampleCount = 1
             loopCount = 0
             while True:
-                if ( options.maxThds == 0 or
-                     (options.maxThds >= len(clist) - batchBegin)):
-                    batchEnd = len(clist)
-                else:
-                    batchEnd = batchBegin + options.maxThds
-                cells = clist[batchBegin:batchEnd]
-                if vmstatCount != None :
-                    # For vmstat, do periodic sampling of vmstat and print as we go.
-                    # the first time through the loop we retrieve just the boot stats
-                    # thereafter we retrieve a delayed sample (sampleCount =2)
-                    while True:
+                for batchBegin, batchEnd in batches:
+                    cells = clist[batchBegin:batchEnd]
+                    if vmstatCount != None :
+                        # For vmstat, do periodic sampling of vmstat and print as we go.
+                        # the first time through the loop we retrieve just the boot stats
+                        # thereafter we retrieve a delayed sample (sampleCount =2)
+                        while True:
+                            statusMap, outputMap, badCells = copyAndExecute(
+                                                   cells, None, None, None,
+                                                   (command or "") +
+                                                   str(sampleCount), options)
+                            if len(badCells) > 0 :
+                                returnValue = 1
+                                sys.stderr.write("Unable to connect to hosts: %s\n" %\
+                                         badCells)
+                            if max( statusMap.values() ) > 0 :
+                                #error returned  ... display results in usual fashion and exit
+                                listResults( clist, statusMap, outputMap, None,
+                                             None, options.preserveSpaces )
+                                break
+                            listVmstatResults( clist, outputMap, options.vmstatOps,
+                                               loopCount)
+                            if batch: break
+                            if vmstatCount >= 0 :
+                                loopCount += 1
+                                if loopCount >= vmstatCount :
+                                    break
+                            sampleCount = 2
+                    else:
                         statusMap, outputMap, badCells = copyAndExecute(
-                                               cells, None, None, None,
-                                               (command or "") +
-                                               str(sampleCount), options)
+                                                               cells,
+                                                               options.file,
+                                                               options.exec_file,
+                                                               options.destfile,
+                                                               command, options)
                         if len(badCells) > 0 :
                             returnValue = 1
                             sys.stderr.write("Unable to connect to hosts: %s\n" %\
-                                     badCells)
-                        if max( statusMap.values() ) > 0 :
-                            #error returned  ... display results in usual fashion and exit
-                            listResults( clist, statusMap, outputMap, None,
-                                         None, options.preserveSpaces )
-                            break
-                        listVmstatResults( clist, outputMap, options.vmstatOps,
-                                           loopCount)
-                        if batch: break
-                        if vmstatCount >= 0 :
-                            loopCount += 1
-                            if loopCount >= vmstatCount :
-                                break
-                        sampleCount = 2
-                else:
-                    statusMap, outputMap, badCells = copyAndExecute(
-                                                           cells,
-                                                           options.file,
-                                                           options.exec_file,
-                                                           options.destfile,
-                                                           command, options)
-                    if len(badCells) > 0 :
-                        returnValue = 1
-                        sys.stderr.write("Unable to connect to hosts: %s\n" %\
-                                     badCells)
-                    listResults( clist, statusMap, outputMap,
-                                 options.listNegatives, options.regexp,
-                                 options.preserveSpaces )
-
-                values = list(statusMap.values()) + [returnValue]
-                returnValue = max( values )
-                if batchEnd == len(clist):
-                    loopCount += 1
-                    if batch and vmstatCount is not None and (vmstatCount < 0 or loopCount < vmstatCount):
-                        batchBegin = 0
-                        sampleCount = 2
-                    else:
-                        break
+                                         badCells)
+                        listResults( clist, statusMap, outputMap,
+                                     options.listNegatives, options.regexp,
+                                     options.preserveSpaces )
+
+                    if statusMap:
+                        returnValue = max( returnValue, max(statusMap.values()) )
+                loopCount += 1
+                if batch and vmstatCount is not None and (vmstatCount < 0 or loopCount < vmstatCount):
+                    sampleCount = 2
                 else:
-                    batchBegin = batchEnd
+                    break
 
     except UsageError as err:
         sys.stderr.write("Error: %s\n" % err.msg)
@@ -0,0 +1,10 @@
+import configparser
+
+# Parse config file once for every helper
+config = configparser.ConfigParser()
+config.read('../config.ini')
+
+DCLI_PATH = "../" + config.get("SYSTEM", "dcli_path")
+EMBED_MODEL_ID = config.get("OCI", "embed_model_id")
+SERVICE_ENDPOINT = config.get("OCI", "service_endpoint")
+COMPARTMENT_ID = config.get("OCI", "compartment_id")
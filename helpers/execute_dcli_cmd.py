@@ -1,32 +1,34 @@
-import importlib.util
+import subprocess
 import sys
-import io
-import shlex
-from contextlib import redirect_stdout
-import configparser
+from config import DCLI_PATH
 
-# Parse config file
-config = configparser.ConfigParser()
-config.read('../config.ini')
-DCLI = "../" + config.get("SYSTEM", "dcli_path")
+def strip_line_prefix(text: str, prefix: str) -> str:
+    """
+    Remove a prefix from the start of every line of text that has it.
+
+    Args:
+        text (str): Text to strip.
+        prefix (str): Prefix to remove, such as "node: ".
 
-spec = importlib.util.spec_from_file_location("dcli", DCLI)
-dcli = importlib.util.module_from_spec(spec)
-sys.modules["dcli"] = dcli
-spec.loader.exec_module(dcli)
+    Returns:
+        str: Text without the prefix.
+    """
+    if text.startswith(prefix):
+        text = text[len(prefix):]
+    return text.replace("\n" + prefix, "\n")
 
-def execute_dcli_cmd(cmd: str) -> str:
+def execute_dcli_cmd_subproc(argv: list[str], strip_prefix: str | None = None) -> str:
     """
-    Execute a dcli command.
+    Execute a dcli command in a separate Python process, so several commands can run at once.
 
     Args:
-        cmd (str): dcli command string of the form "dcli [options] [command]".
-    
+        argv (list[str]): dcli arguments of the form ["dcli", *options, command].
+        strip_prefix (str | None): Prefix to remove from the start of each output line, such as "node: ".
+
     Returns:
         str: Output from dcli utility.
     """
-    argv = shlex.split(cmd)
-    out = io.StringIO()
-    with redirect_stdout(out):
-        dcli.main(argv)
-    return(out.getvalue())
\ No newline at end of file
+    result = subprocess.run([sys.executable, DCLI_PATH, *argv[1:]], stdout=subprocess.PIPE, text=True)
+    if not strip_prefix:
+        return result.stdout
+    return strip_line_prefix(result.stdout, strip_prefix)
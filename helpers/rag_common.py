@@ -0,0 +1,260 @@
+from execute_dcli_cmd import execute_dcli_cmd_subproc
+from langchain_text_splitters import RecursiveJsonSplitter, MarkdownHeaderTextSplitter
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import hashlib
+import json
+import mmap
+import os
+import re
+import uuid
+
+# Line printed between the outputs of commands run in one dcli call
+SPLIT_MARKER = "==SPLIT=="
+# dcli's default limit on output lines per call, allowed for each command of a combined call
+DCLI_MAX_LINES = 100000
+
+# Each "key: value" line of a block is one attribute
+ATTRIBUTE_LINE = re.compile(r"^([^:]*):(.*)$")
+# Whitespace and quotes trimmed from both ends of an attribute value
+VALUE_STRIP_CHARS = ' \t\r\n"'
+
+# Flags in front of an attribute's description in describe output
+ATTRIBUTE_FLAGS = re.compile(r"^(?:modifiable\s*)?(?:hidden\s*)?")
+
+def execute_node_cmds(node: str, cmds: list[str]) -> list[str]:
+    """
+    Run several commands on a node with a single dcli call, falling back to one call per command
+    if the combined output was cut short.
+
+    Args:
+        node (str): Node to run the commands on.
+        cmds (list[str]): Shell commands to run, in order.
+
+    Returns:
+        list[str]: Output of each command, without the node prefix.
+    """
+    script = f"; echo {SPLIT_MARKER}; ".join(cmds)
+    max_lines = str(DCLI_MAX_LINES * len(cmds))
+    dcli_output = execute_dcli_cmd_subproc(["dcli", "--maxlines", max_lines, "-l", "root", "-c", node, script], strip_prefix=f"{node}: ")
+    outputs = dcli_output.split(f"{SPLIT_MARKER}\n")
+    if len(outputs) == len(cmds):
+        return outputs
+    return [execute_dcli_cmd_subproc(["dcli", "-l", "root", "-c", node, cmd], strip_prefix=f"{node}: ") for cmd in cmds]
+
+def execute_nodes_cmds(node_cmds: dict[str, list[str]]) -> dict[str, list[str]]:
+    """
+    Run each node's commands with execute_node_cmds, with the nodes in parallel.
+
+    Args:
+        node_cmds (dict[str, list[str]]): Shell commands to run on each node, in order.
+
+    Returns:
+        dict[str, list[str]]: Output of each command for each node.
+    """
+    with ThreadPoolExecutor(max_workers=len(node_cmds)) as executor:
+        futures = {node: executor.submit(execute_node_cmds, node, cmds) for node, cmds in node_cmds.items()}
+    return {node: future.result() for node, future in futures.items()}
+
+def iter_blocks(text: str) -> Iterator[list[str]]:
+    """
+    Yield the lines of each block of text, where blocks are separated by blank lines.
+
+    Args:
+        text (str): Text to split into blocks.
+
+    Yields:
+        list[str]: Non-blank lines of one block.
+    """
+    block = []
+    for line in text.splitlines():
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+def parse_blocks(text: str) -> list[dict[str, str]]:
+    """
+    Parse blocks of "key: value" lines separated by blank lines.
+
+    Args:
+        text (str): Output to parse.
+
+    Returns:
+        list[dict[str, str]]: Attributes of each block that has any.
+    """
+    blocks = []
+    for block in iter_blocks(text):
+        attributes = {}
+        for line in block:
+            match = ATTRIBUTE_LINE.match(line)
+            if match:
+                attributes[match.group(1).strip()] = match.group(2).strip(VALUE_STRIP_CHARS)
+        if attributes:
+            blocks.append(attributes)
+    return blocks
+
+def process_help(output: str) -> str:
+    """
+    Format help output for a RAG file.
+
+    Args:
+        output (str): Output of the help commands.
+
+    Returns:
+        str: Help text without its leading and trailing newline.
+    """
+    return output[1:-1]
+
+def process_describe(output: str) -> str:
+    """
+    Format describe output for a RAG file as "attribute: description" lines.
+
+    Args:
+        output (str): Output of the describe commands.
+
+    Returns:
+        str: Describe text with the modifiable and hidden flags removed.
+    """
+    lines = []
+    for line in output.strip().split("\n"):
+        if line and not line.startswith("Attributes for"):
+            parts = line.split(maxsplit=1)
+            if len(parts) > 1:
+                parts[1] = ATTRIBUTE_FLAGS.sub("", parts[1]).strip()
+            if len(parts) > 1 and parts[1]:
+                line = ": ".join(parts)
+            else:
+                line = parts[0]
+        lines.append(line)
+    return "\n".join(lines)
+
+def write_rag_files(rag_dir: str, node_type: str, cli: str, outputs: list[str]) -> None:
+    """
+    Write the metric definition, help, and describe RAG files for a node type.
+
+    Args:
+        rag_dir (str): Directory to write the files to.
+        node_type (str): Node type prefix of the metric definitions file, "db" or "cell".
+        cli (str): CLI name prefix of the help and describe files.
+        outputs (list[str]): Metric definition, help, and describe command outputs.
+    """
+    metric_output, help_output, describe_output = outputs
+    with open(f"{rag_dir}/{node_type}_metric_definitions.json", "w") as file:
+        json.dump(parse_blocks(metric_output), file, indent=2)
+    with open(f"{rag_dir}/{cli}_help.txt", "w") as file:
+        print(process_help(help_output), file=file)
+    with open(f"{rag_dir}/{cli}_describe.txt", "w") as file:
+        print(process_describe(describe_output), file=file)
+
+# Create JSON splitter
+json_splitter = RecursiveJsonSplitter()
+
+# Create Markdown splitters
+help_splitter = MarkdownHeaderTextSplitter([("Help for", "command")])
+describe_splitter = MarkdownHeaderTextSplitter([("Attributes for", "object")])
+
+def split_json(text: str) -> list:
+    """
+    Split a JSON RAG file's text into documents.
+    """
+    return json_splitter.create_documents(texts=json.loads(text))
+
+def build_store(documents: list, vectors: list[list[float]], embeddings: Embeddings, out_path: str) -> None:
+    """
+    Dump a vector store of documents whose embeddings are already computed.
+
+    Args:
+        documents (list[Document]): Documents to add to the vector store.
+        vectors (list[list[float]]): Embedding of each document.
+        embeddings (Embeddings): Embedding model of the vector store.
+        out_path (str): Path to dump the vector store to.
+    """
+    vector_store = InMemoryVectorStore(embeddings)
+    for document, vector in zip(documents, vectors):
+        doc_id = document.id or str(uuid.uuid4())
+        vector_store.store[doc_id] = {
+            "id": doc_id,
+            "vector": vector,
+            "text": document.page_content,
+            "metadata": document.metadata,
+        }
+    vector_store.dump(out_path)
+
+def read_meta(out_path: str) -> dict:
+    """
+    Read the sidecar metadata written next to a vector store.
+
+    Args:
+        out_path (str): Path of the vector store.
+
+    Returns:
+        dict: Hash of the RAG file and embedding model the store was built from, or {} if unknown.
+    """
+    try:
+        with open(f"{out_path}.meta.json", "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+@contextmanager
+def map_file(path: str) -> Iterator[bytes | mmap.mmap]:
+    """
+    Map a file into memory read-only, so it can be hashed and decoded without copying it.
+
+    Args:
+        path (str): Path of the file.
+
+    Yields:
+        bytes | mmap.mmap: Contents of the file, b"" if it is empty since empty files cannot be mapped.
+    """
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+def write_vector_stores(rag_dir: str, rag_files: list[tuple[str, Callable[[str], list]]], embeddings: Embeddings, model_id: str) -> None:
+    """
+    Write a vector store for each RAG file whose contents or embedding model changed since its store was built.
+
+    Args:
+        rag_dir (str): Directory of the RAG files and vector stores.
+        rag_files (list[tuple[str, Callable[[str], list]]]): RAG file names and the function that splits each into documents.
+        embeddings (Embeddings): Embedding model, whose batch_size sets the texts per request.
+        model_id (str): Embedding model ID, part of each vector store's file name.
+    """
+    # Split every RAG file up front so embedding requests can be filled across files
+    groups = []
+    for name, split in rag_files:
+        out_path = f"{rag_dir}/{name.rsplit('.', 1)[0]}_{model_id}.pkl"
+        with map_file(f"{rag_dir}/{name}") as data:
+            # Skip files whose vector store was already built from the same contents and model
+            meta = {"sha256": hashlib.sha256(data).hexdigest(), "model": model_id}
+            if os.path.exists(out_path) and read_meta(out_path) == meta:
+                print(f"Skipped {out_path}, {name} is unchanged")
+                continue
+            text = str(data, "utf-8")
+        groups.append((out_path, meta, split(text)))
+
+    texts = [document.page_content for _, _, documents in groups for document in documents]
+    batches = [texts[i:i + embeddings.batch_size] for i in range(0, len(texts), embeddings.batch_size)]
+
+    # Embedding is network bound, so send the batches in parallel
+    with ThreadPoolExecutor(max_workers=len(rag_files)) as executor:
+        vectors = [vector for batch in executor.map(embeddings.embed_documents, batches) for vector in batch]
+
+    offset = 0
+    for out_path, meta, documents in groups:
+        build_store(documents, vectors[offset:offset + len(documents)], embeddings, out_path)
+        with open(f"{out_path}.meta.json", "w") as file:
+            json.dump(meta, file)
+        offset += len(documents)
+        print(f"Wrote {out_path}")
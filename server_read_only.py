@@ -1,7 +1,9 @@
 from typing import Annotated, Literal
 from pydantic import Field
 from fastmcp import FastMCP, Context
+import asyncio
 import configparser
+import functools
 import importlib.util
 import sys
 from contextlib import redirect_stdout
@@ -9,13 +11,16 @@ import io
 import shlex
 from datetime import datetime
 import re
+import time
 
 # LangChain imports for RAG
 from langchain_community.embeddings import OCIGenAIEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.vectorstores import VectorStoreRetriever
 
 # Custom imports
 import workarounds
+from cached_embeddings import CachedEmbeddings
+from vector_store import MatrixVectorStore
 
 # =====
 # Setup
@@ -37,6 +42,15 @@ COMPARTMENT_ID = config.get("OCI", "compartment_id")
 DB_NODES = [node.strip() for node in config.get("SYSTEM", "db_nodes").split(',')]
 CELL_NODES = [node.strip() for node in config.get("SYSTEM", "cell_nodes").split(',')]
 DCLI_PATH = config.get("SYSTEM", "dcli_path")
+# Seconds dcli keeps ssh connections to the nodes open between tool calls
+DCLI_CONTROL_PERSIST = 60
+# Seconds the output of a read-only dcli command is reused by identical commands
+DCLI_CACHE_TTL = 5
+# Most dcli command outputs kept at once
+DCLI_CACHE_SIZE = 256
+# Node commands whose output may be cached: a single CellCLI or DBMCLI list, or a cat of one file,
+# with nothing the shell or CLI could use to chain another command
+READ_ONLY_NODE_CMD = re.compile(r"(?:(?:cellcli|dbmcli) -e (?i:list)\s(?!.*\s-e\s)[^;&|`$<>\\\n]*|cat [^;&|`$<>\\\s]+)")
 
 # Import dcli from path
 spec = importlib.util.spec_from_file_location("dcli", DCLI_PATH)
@@ -44,9 +58,66 @@ dcli = importlib.util.module_from_spec(spec)
 sys.modules["dcli"] = dcli
 spec.loader.exec_module(dcli)
 
+# Output of recent read-only dcli commands, as (expiry time, output) by command
+dcli_cache: dict[str, tuple[float, str]] = {}
+# Running read-only dcli commands, shared by tool calls that issue the same command at once
+dcli_in_flight: dict[str, asyncio.Future] = {}
+
+def is_read_only_dcli_cmd(cmd: str) -> bool:
+    """
+    Check whether a dcli command only reads from the nodes, so its output can be reused.
+    Only commands of the form "dcli -l root -c <nodes> <node command>" are considered.
+
+    Args:
+        cmd (str): dcli command string of the form "dcli [options] [command]".
+
+    Returns:
+        bool: True if the node command is a single list or cat that changes nothing.
+    """
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return False
+    if len(argv) < 6 or argv[:4] != ["dcli", "-l", "root", "-c"]:
+        return False
+    return bool(READ_ONLY_NODE_CMD.fullmatch(" ".join(argv[5:])))
+
+def get_cached_dcli_output(cmd: str) -> str | None:
+    """
+    Get the output of a read-only dcli command run within the last DCLI_CACHE_TTL seconds.
+
+    Args:
+        cmd (str): dcli command string of the form "dcli [options] [command]".
+
+    Returns:
+        str | None: Cached output, or None if there is none or it has expired.
+    """
+    entry = dcli_cache.get(cmd)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    return entry[1]
+
+def cache_dcli_output(cmd: str, output: str) -> None:
+    """
+    Cache the output of a read-only dcli command, making room by dropping expired entries and then the oldest.
+
+    Args:
+        cmd (str): dcli command string of the form "dcli [options] [command]".
+        output (str): Output of the command.
+    """
+    now = time.monotonic()
+    if len(dcli_cache) >= DCLI_CACHE_SIZE:
+        for key in [key for key, (expiry, _) in dcli_cache.items() if expiry <= now]:
+            del dcli_cache[key]
+        while len(dcli_cache) >= DCLI_CACHE_SIZE:
+            del dcli_cache[next(iter(dcli_cache))]
+    dcli_cache.pop(cmd, None)
+    dcli_cache[cmd] = (now + DCLI_CACHE_TTL, output)
+
 def execute_dcli_cmd(cmd: str) -> str:
     """
     Execute a dcli command.
+    Read-only commands reuse output from the last DCLI_CACHE_TTL seconds, and any other command clears the cache, since it may change the nodes.
 
     Args:
         cmd (str): dcli command string of the form "dcli [options] [command]".
@@ -54,49 +125,121 @@ def execute_dcli_cmd(cmd: str) -> str:
     Returns:
         str: Output from dcli utility.
     """
+    read_only = is_read_only_dcli_cmd(cmd)
+    if read_only and (output := get_cached_dcli_output(cmd)) is not None:
+        return output
     argv = shlex.split(cmd)
+    argv.insert(1, f"--control-persist={DCLI_CONTROL_PERSIST}")
     out = io.StringIO()
     with redirect_stdout(out):
         dcli.main(argv)
-    if not out.getvalue():
+    output = out.getvalue() or "Output is empty."
+    if read_only:
+        cache_dcli_output(cmd, output)
+    else:
+        dcli_cache.clear()
+    return output
+
+async def run_dcli_cmd_async(cmd: str) -> str:
+    """
+    Run a dcli command in a separate process, for commands with large output.
+    The output is read as bytes and decoded once instead of passing through redirected prints, and other tools keep running while it waits.
+
+    Args:
+        cmd (str): dcli command string of the form "dcli [options] [command]".
+    
+    Returns:
+        str: Output from dcli utility.
+    """
+    argv = shlex.split(cmd)
+    argv.insert(1, f"--control-persist={DCLI_CONTROL_PERSIST}")
+    # Keep the child off stdin, which carries the MCP stdio transport
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, DCLI_PATH, *argv[1:],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, _ = await process.communicate()
+    except asyncio.CancelledError:
+        # Do not leave dcli and its ssh sessions running for a cancelled tool call
+        process.kill()
+        await process.wait()
+        raise
+    output = stdout.decode(errors="replace")
+    if not output:
         return "Output is empty."
-    return(out.getvalue())
+    return output
+
+async def execute_dcli_cmd_async(cmd: str) -> str:
+    """
+    Execute a dcli command in a separate process with run_dcli_cmd_async.
+    Read-only commands reuse cached output like execute_dcli_cmd, and concurrent calls with the same read-only command share one dcli run.
+
+    Args:
+        cmd (str): dcli command string of the form "dcli [options] [command]".
+    
+    Returns:
+        str: Output from dcli utility.
+    """
+    if not is_read_only_dcli_cmd(cmd):
+        output = await run_dcli_cmd_async(cmd)
+        dcli_cache.clear()
+        return output
+    output = get_cached_dcli_output(cmd)
+    if output is not None:
+        return output
+    future = dcli_in_flight.get(cmd)
+    if future is None:
+        future = asyncio.ensure_future(run_dcli_cmd_async(cmd))
+        future.add_done_callback(lambda _: dcli_in_flight.pop(cmd, None))
+        dcli_in_flight[cmd] = future
+    # Shield the shared run, so a cancelled tool call does not cancel it for the others
+    output = await asyncio.shield(future)
+    cache_dcli_output(cmd, output)
+    return output
 
 # =========
 # RAG setup
 # =========
 
-# Initialize embed model
-embed_model = OCIGenAIEmbeddings(
+# Initialize embed model, caching query embeddings across tool calls
+embed_model = CachedEmbeddings(OCIGenAIEmbeddings(
     model_id=EMBED_MODEL_ID,
     service_endpoint=SERVICE_ENDPOINT,
     compartment_id=COMPARTMENT_ID,
-)
-
-# Load vector stores and initialize retrievers
-db_metric_vector_store = InMemoryVectorStore.load(f"rag_read_only/db_metric_definitions_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-db_metric_retriever = db_metric_vector_store.as_retriever(search_kwargs={"k": 8})
+))
 
-cell_metric_vector_store = InMemoryVectorStore.load(f"rag_read_only/cell_metric_definitions_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-cell_metric_retriever = cell_metric_vector_store.as_retriever(search_kwargs={"k": 8})
+# Number of documents the retriever for each RAG file returns
+RETRIEVER_K = {
+    "db_metric_definitions": 8,
+    "cell_metric_definitions": 8,
+    "dbmcli_help": 3,
+    "cellcli_help": 3,
+    "dbmcli_describe": 3,
+    "cellcli_describe": 3,
+}
 
-dbmcli_help_vector_store = InMemoryVectorStore.load(f"rag_read_only/dbmcli_help_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-dbmcli_help_retriever = dbmcli_help_vector_store.as_retriever(search_kwargs={"k": 3})
-
-cellcli_help_vector_store = InMemoryVectorStore.load(f"rag_read_only/cellcli_help_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-cellcli_help_retriever = cellcli_help_vector_store.as_retriever(search_kwargs={"k": 3})
-
-dbmcli_describe_vector_store = InMemoryVectorStore.load(f"rag_read_only/dbmcli_describe_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-dbmcli_describe_retriever = dbmcli_describe_vector_store.as_retriever(search_kwargs={"k": 3})
+# Load vector stores on first use, since each tool only needs some of them
+@functools.cache
+def get_vector_store(rag_file: str) -> MatrixVectorStore:
+    """
+    Load the vector store for a RAG file into a contiguous matrix.
+    """
+    return MatrixVectorStore.load(f"rag_read_only/{rag_file}_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
 
-cellcli_describe_vector_store = InMemoryVectorStore.load(f"rag_read_only/cellcli_describe_{EMBED_MODEL_ID}.pkl", embedding=embed_model)
-cellcli_describe_retriever = cellcli_describe_vector_store.as_retriever(search_kwargs={"k": 3})
+@functools.cache
+def get_retriever(rag_file: str) -> VectorStoreRetriever:
+    """
+    Get the retriever for a RAG file, loading its vector store if needed.
+    """
+    return get_vector_store(rag_file).as_retriever(search_kwargs={"k": RETRIEVER_K[rag_file]})
 
 # ==========
 # Poll agent
 # ==========
 
-def get_query(
+async def get_query(
     node: Annotated[
         str,
         Field(description="Single node.")
@@ -110,9 +253,9 @@ def get_query(
     Get a query from a node.
     """
     cmd = f"dcli -l root -c {node} 'cellcli -e list {node_type} attributes questionForLlm'"
-    return execute_dcli_cmd(cmd)
+    return await execute_dcli_cmd_async(cmd)
 
-def set_response(
+async def set_response(
     node: Annotated[
         str,
         Field(description="Single node.")
@@ -130,20 +273,17 @@ def set_response(
     Set a response on a node.
     """
     cmd = f"dcli -l root -c {node} 'cellcli -e \"alter {node_type} answerFromLlm=\\\"{response}\\\"\"'"
-    execute_dcli_cmd(cmd)
+    await execute_dcli_cmd_async(cmd)
 
-def polling_supported() -> bool:
+async def polling_supported() -> bool:
     """
-    Check that Q&A attributes exist on every node of the fleet.
+    Check that Q&A attributes exist on every node of the fleet, probing the database and storage nodes concurrently.
     """
     error = "01504: Invalid command syntax."
     db_cmd = f"dcli -l root -c {','.join(DB_NODES)} 'cellcli -e list dbserver attributes questionForLlm,answerFromLlm'"
-    if error in execute_dcli_cmd(db_cmd):
-        return False
     cell_cmd = f"dcli -l root -c {','.join(CELL_NODES)} 'cellcli -e list cell attributes questionForLlm,answerFromLlm'"
-    if error in execute_dcli_cmd(cell_cmd):
-        return False
-    return True
+    outputs = await asyncio.gather(execute_dcli_cmd_async(db_cmd), execute_dcli_cmd_async(cell_cmd))
+    return all(error not in output for output in outputs)
 
 # =======================
 # Generalizable RAG tools
@@ -167,7 +307,7 @@ async def list_db_object(
     """
     db_nodes = "".join(db_nodes.split())
     # Get candidate help documents with RAG
-    docs = dbmcli_describe_retriever.invoke(natural_language_request)
+    docs = await get_retriever("dbmcli_describe").ainvoke(natural_language_request)
     doc_dict = {}
     for doc in docs:
         obj = doc.metadata["object"]
@@ -189,7 +329,7 @@ async def list_db_object(
     if obj.startswith("Error:"):
         return obj
     describe_doc = doc_dict[obj]
-    help_doc = f"Help for LIST {obj}:\n" + dbmcli_help_vector_store.similarity_search(query=obj, k=1, filter=lambda doc: doc.metadata["command"] == "LIST " + obj)[0].page_content
+    help_doc = f"Help for LIST {obj}:\n" + get_vector_store("dbmcli_help").similarity_search(query=obj, k=1, filter=lambda doc: doc.metadata["command"] == "LIST " + obj)[0].page_content
     doc = f"Action: LIST {obj}\n\n" + help_doc + "\n\n" + describe_doc
     # Sample LLM to construct command
     prompt = f"""
@@ -233,7 +373,7 @@ async def list_cell_object(
     """
     cell_nodes = "".join(cell_nodes.split())
     # Get candidate help documents with RAG
-    docs = cellcli_describe_retriever.invoke(natural_language_request)
+    docs = await get_retriever("cellcli_describe").ainvoke(natural_language_request)
     doc_dict = {}
     for doc in docs:
         obj = doc.metadata["object"]
@@ -255,7 +395,7 @@ async def list_cell_object(
     if obj.startswith("Error:"):
         return obj
     describe_doc = doc_dict[obj]
-    help_doc = f"Help for LIST {obj}:\n" + cellcli_help_vector_store.similarity_search(query=obj, k=1, filter=lambda doc: doc.metadata["command"] == "LIST " + obj)[0].page_content
+    help_doc = f"Help for LIST {obj}:\n" + get_vector_store("cellcli_help").similarity_search(query=obj, k=1, filter=lambda doc: doc.metadata["command"] == "LIST " + obj)[0].page_content
     doc = f"Action: LIST {obj}\n\n" + help_doc + "\n\n" + describe_doc
     # Sample LLM to construct command
     prompt = f"""
@@ -303,14 +443,15 @@ async def get_current_metric(
     """
     if not cell_nodes and not db_nodes:
         return "Error: At least one node must be specified."
-    # Get metric for cell nodes
-    if cell_nodes:
-        cell_nodes = "".join(cell_nodes.split())
-        docs = cell_metric_retriever.invoke(description)
+    async def get_metric(nodes: str, rag_file: str, node_type: str, cli: str) -> str:
+        if not nodes:
+            return ""
+        nodes = "".join(nodes.split())
+        docs = await get_retriever(rag_file).ainvoke(description)
         docs = "\n".join([doc.page_content for doc in docs])
         prompt = f"""
         You will receive a description, along with several candidate metrics.
-        If none of the metrics fit the description, output "Error: No cell node metric fits the description."
+        If none of the metrics fit the description, output "Error: No {node_type} node metric fits the description."
         Otherwise, output only the name of the best metric.
 
         Description: {description}
@@ -321,36 +462,16 @@ async def get_current_metric(
         llm_output = await ctx.sample(prompt)
         llm_output = llm_output.text
         if llm_output.startswith("Error:"):
-            cell_result = llm_output
-        else:
-            cell_cmd = f"dcli -l root -c {cell_nodes} 'cellcli -e list metriccurrent {llm_output} detail'"
-            cell_result = execute_dcli_cmd(cell_cmd)
-    else:
-        cell_result = ""
-    # Get metric for database nodes
-    if db_nodes:
-        db_nodes = "".join(db_nodes.split())
-        docs = db_metric_retriever.invoke(description)
-        docs = "\n".join([doc.page_content for doc in docs])
-        prompt = f"""
-        You will receive a description, along with several candidate metrics.
-        If none of the metrics fit the description, output "Error: No database node metric fits the description."
-        Otherwise, output only the name of the best metric.
-
-        Description: {description}
-        
-        Metrics:
-        {docs}
-        """
-        llm_output = await ctx.sample(prompt)
-        llm_output = llm_output.text
-        if llm_output.startswith("Error:"):
-            db_result = llm_output
-        else:
-            db_cmd = f"dcli -l root -c {db_nodes} 'dbmcli -e list metriccurrent {llm_output} detail'"
-            db_result = execute_dcli_cmd(db_cmd)
-    else:
-        db_result = ""
+            return llm_output
+        cmd = f"dcli -l root -c {nodes} '{cli} -e list metriccurrent {llm_output} detail'"
+        # dcli captures the global stdout, so it runs on the event loop and never in two threads at once
+        return execute_dcli_cmd(cmd)
+
+    # Get metric for cell nodes and database nodes, with retrieval and sampling overlapped
+    cell_result, db_result = await asyncio.gather(
+        get_metric(cell_nodes, "cell_metric_definitions", "cell", "cellcli"),
+        get_metric(db_nodes, "db_metric_definitions", "database", "dbmcli"),
+    )
     return cell_result + db_result
 
 # ===================
@@ -438,8 +559,37 @@ def get_alert_history(
     cmd = f"dcli -l root -c {nodes} 'cellcli -e list alerthistory detail'"
     return execute_dcli_cmd(cmd)
 
+# Month numbers of the abbreviated month names in syslog timestamps
+SYSLOG_MONTHS = {month: i for i, month in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1)}
+# Most characters of system messages returned at once
+MAX_SYSTEM_MESSAGES_CHARS = 50000
+
+def parse_syslog_timestamp(timestamp: str) -> tuple[int, int, int, int, int] | None:
+    """
+    Parse a syslog timestamp of the form "%b %d %H:%M:%S" without strptime.
+
+    Args:
+        timestamp (str): Timestamp such as "Jul 16 13:15:21".
+
+    Returns:
+        tuple[int, int, int, int, int] | None: Month, day, hour, minute, and second, or None if the timestamp is invalid.
+    """
+    fields = timestamp.split()
+    if len(fields) != 3 or fields[0] not in SYSLOG_MONTHS:
+        return None
+    clock = fields[2].split(":")
+    if len(clock) != 3:
+        return None
+    try:
+        day, hour, minute, second = int(fields[1]), int(clock[0]), int(clock[1]), int(clock[2])
+    except ValueError:
+        return None
+    if not (1 <= day <= 31 and hour < 24 and minute < 60 and second < 62):
+        return None
+    return (SYSLOG_MONTHS[fields[0]], day, hour, minute, second)
+
 @mcp.tool
-def get_system_messages(
+async def get_system_messages(
     nodes: Annotated[
         str,
         Field(description="Comma-separated list of one or more nodes.")
@@ -458,10 +608,7 @@ def get_system_messages(
     System messages reveal actions of processes related to the system of a node. They can help determine causes of events and aid in debugging.
     To check system messages around a certain time, set start_datetime_str to 5 minutes before that time and end_datetime_str to 5 minutes after that time.
     """
-    nodes = "".join(nodes.split())
-    cmd = f"dcli -l root -c {nodes} cat /var/log/messages"
-    data = execute_dcli_cmd(cmd).split("\n")
-    # Process start and end datetimes
+    # Process start and end datetimes before reading the logs
     current_year_str = str(datetime.now().year)
     datetime_format = "%Y %b %d %H:%M:%S"
     try:
@@ -471,26 +618,39 @@ def get_system_messages(
         return "Error: Invalid datetime format."
     if start_datetime > end_datetime:
         return "Error: Invalid datetime range."
-    # Filter log messages
-    filtered_data = ""
+    nodes = "".join(nodes.split())
+    cmd = f"dcli -l root -c {nodes} cat /var/log/messages"
+    data = (await execute_dcli_cmd_async(cmd)).split("\n")
+    # Filter log messages, comparing timestamps as tuples since every line is in the current year
+    start = (start_datetime.month, start_datetime.day, start_datetime.hour, start_datetime.minute, start_datetime.second)
+    end = (end_datetime.month, end_datetime.day, end_datetime.hour, end_datetime.minute, end_datetime.second)
+    timestamp_len = len(start_datetime_str)
+    lines = []
+    size = 0
     for line in data:
-        try:
-            timestamp = current_year_str + " " + line.split(" ", 1)[1][:len(start_datetime_str)]
-            log_datetime = datetime.strptime(timestamp, datetime_format)
-            if start_datetime <= log_datetime <= end_datetime:
-                filtered_data += line + "\n"
-        except ValueError:
-            pass
-        except IndexError:
-            pass
-    if len(filtered_data) > 50000:
+        parts = line.split(" ", 1)
+        if len(parts) < 2:
+            continue
+        log_timestamp = parse_syslog_timestamp(parts[1][:timestamp_len])
+        if log_timestamp is not None and start <= log_timestamp <= end:
+            lines.append(line + "\n")
+            size += len(line) + 1
+            if size > MAX_SYSTEM_MESSAGES_CHARS:
+                break
+    filtered_data = "".join(lines)
+    if len(filtered_data) > MAX_SYSTEM_MESSAGES_CHARS:
         return "Error: The time range is too large. Please specify a shorter time range."
     if not filtered_data:
         return "There are no messages from this time range."
     return filtered_data
 
+# Time attribute in the opening tag of an alert log message, compiled once for every call
+ALERT_LOG_TIME_PATTERN = re.compile(r"time='([\d\-T\:\.]+(?:[\+\-]\d{2}:\d{2})?)'")
+# Most characters of alert log messages returned at once
+MAX_ALERT_LOG_CHARS = 50000
+
 @mcp.tool
-def get_alert_log(
+async def get_alert_log(
     nodes: Annotated[
         str,
         Field(description="Comma-separated list of one or more nodes.")
@@ -525,10 +685,7 @@ def get_alert_log(
         log_path = "/var/log/oracle/diag/EXC/exc/`hostname -s`/alert/log.xml"
     else:
         log_path = f"/var/log/oracle/diag/asm/{service_type}/`hostname -s`/alert/log.xml"
-    nodes = "".join(nodes.split())
-    cmd = f"dcli -l root -c {nodes} cat {log_path}"
-    data = execute_dcli_cmd(cmd)
-    # Process start and end datetimes
+    # Process start and end datetimes before reading the logs
     try:
         start_datetime = datetime.fromisoformat(start_datetime_str)
         end_datetime = datetime.fromisoformat(end_datetime_str)
@@ -536,20 +693,36 @@ def get_alert_log(
         return "Error: Invalid datetime format."
     if start_datetime > end_datetime:
         return "Error: Invalid datetime range."
-    # Filter log messages
-    filtered_data = ""
-    # Pattern to capture each message block
-    msg_pattern = r"([^\n]*?:\s*<msg[^>]+>.*?</msg>)"
-    # Pattern to extract the time
-    time_pattern = r"time='([\d\-T\:\.]+(?:[\+\-]\d{2}:\d{2})?)'"
-    for match in re.finditer(msg_pattern, data, re.DOTALL):
-        block = match.group(1)
-        time_match = re.search(time_pattern, block)
+    nodes = "".join(nodes.split())
+    cmd = f"dcli -l root -c {nodes} cat {log_path}"
+    data = await execute_dcli_cmd_async(cmd)
+    # Filter log messages in one forward scan, stopping once the result is too large
+    blocks = []
+    size = 0
+    pos = 0
+    while size <= MAX_ALERT_LOG_CHARS:
+        start = data.find("<msg", pos)
+        if start < 0:
+            break
+        end = data.find("</msg>", start)
+        if end < 0:
+            break
+        end += len("</msg>")
+        # Each message block starts with the "node: " prefix of its first line
+        block_start = max(data.rfind("\n", 0, start) + 1, pos)
+        if not data[block_start:start].rstrip().endswith(":"):
+            pos = start + len("<msg")
+            continue
+        # The time is an attribute of the opening tag, so the message text is never searched
+        time_match = ALERT_LOG_TIME_PATTERN.search(data, start, data.find(">", start, end))
         if time_match:
             log_datetime = datetime.fromisoformat(time_match.group(1))
             if start_datetime <= log_datetime <= end_datetime:
-                filtered_data += block
-    if len(filtered_data) > 50000:
+                blocks.append(data[block_start:end])
+                size += end - block_start
+        pos = end
+    filtered_data = "".join(blocks)
+    if len(filtered_data) > MAX_ALERT_LOG_CHARS:
         return "Error: The time range is too large. Please specify a shorter time range."
     if not filtered_data:
         return "There are no messages from this time range."
@@ -0,0 +1,132 @@
+# ==========================
+# Matrix-backed vector store
+# ==========================
+
+from typing import Any, Callable, Optional
+import os
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+def _quantize(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize each row of a float32 matrix to int8 with a per-row scale.
+    """
+    scales = np.abs(matrix).max(axis=1, initial=0) / 127
+    scales[scales == 0] = 1
+    quantized = np.round(matrix / scales[:, np.newaxis]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def _matrix_paths(path: str) -> tuple[str, str]:
+    """
+    Paths of the quantized matrix and row scales saved beside a vector store file.
+    """
+    return f"{path}.int8.npy", f"{path}.scales.npy"
+
+class MatrixVectorStore(InMemoryVectorStore):
+    """
+    In-memory vector store that keeps normalized embeddings in a contiguous int8 matrix with a
+    float32 scale per row, a quarter of the size of float32 embeddings. Similarity search is a
+    single matrix-vector product plus a partial sort, and the matrix is only rebuilt after the
+    store has changed.
+    """
+
+    def __init__(self, embedding: Embeddings, **kwargs: Any) -> None:
+        super().__init__(embedding=embedding, **kwargs)
+        # Entries, quantized matrix, and row scales, replaced together so a search running in
+        # another thread never sees a matrix from one version of the store with entries of another
+        self._index: tuple[list[dict[str, Any]], np.ndarray, np.ndarray] = (
+            [], np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, **kwargs: Any) -> "MatrixVectorStore":
+        # Build the quantized matrix up front so the first search does not pay for it, reusing the
+        # one saved beside the store when the store has not changed since
+        vector_store = super().load(path, embedding, **kwargs)
+        if not vector_store._load_matrix(path):
+            vector_store._refresh_matrix()
+            vector_store._save_matrix(path)
+        return vector_store
+
+    def _load_matrix(self, path: str) -> bool:
+        matrix_path, scales_path = _matrix_paths(path)
+        try:
+            if min(os.path.getmtime(matrix_path), os.path.getmtime(scales_path)) < os.path.getmtime(path):
+                return False
+            # Map the saved arrays read-only so pages are only read in as searches touch them
+            matrix = np.load(matrix_path, mmap_mode="r")
+            scales = np.load(scales_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        entries = list(self.store.values())
+        if len(matrix) != len(entries) or len(scales) != len(entries):
+            return False
+        self._index = (entries, matrix, scales)
+        return True
+
+    def _save_matrix(self, path: str) -> None:
+        matrix_path, scales_path = _matrix_paths(path)
+        _, matrix, scales = self._index
+        try:
+            np.save(matrix_path, matrix)
+            np.save(scales_path, scales)
+        except OSError:
+            # The matrix is only a cache, so a read-only directory just means rebuilding it next time
+            pass
+
+    def _refresh_matrix(self) -> None:
+        # Every write replaces the stored entry dicts, so comparing identities detects changes
+        entries = list(self.store.values())
+        old_entries, quantized, scales = self._index
+        if len(entries) == len(old_entries) and all(a is b for a, b in zip(entries, old_entries)):
+            return
+        if len(entries):
+            matrix = np.asarray([entry["vector"] for entry in entries], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            matrix /= norms
+            quantized, scales = _quantize(matrix)
+        self._index = (entries, quantized, scales)
+
+    def _similarity_search_with_score_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[Callable[[Document], bool]] = None,
+    ) -> list[tuple[Document, float, list[float]]]:
+        self._refresh_matrix()
+        entries, matrix, scales = self._index
+        if not entries:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query /= norm
+        query, query_scale = _quantize(query[np.newaxis, :])
+        # Cosine similarity of normalized vectors is their dot product, accumulated in int32
+        # one buffer at a time instead of upcasting the whole matrix, then rescaled from int8
+        dots = np.einsum("ij,j->i", matrix, query[0], dtype=np.int32)
+        scores = dots * scales * query_scale[0]
+        indices = np.arange(len(entries))
+        if filter is not None:
+            indices = np.array([
+                i for i in indices
+                if filter(Document(page_content=entries[i]["text"], metadata=entries[i]["metadata"]))
+            ], dtype=np.intp)
+            if not len(indices):
+                return []
+        # Select the top k without sorting every score
+        candidates = scores[indices]
+        if k < len(candidates):
+            top = np.argpartition(-candidates, k)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-candidates[top])]
+        results = []
+        for i in indices[top]:
+            entry = entries[i]
+            document = Document(id=entry["id"], page_content=entry["text"], metadata=entry["metadata"])
+            results.append((document, float(scores[i]), entry["vector"]))
+        return results